@@ -0,0 +1,224 @@
+"""
+Script used for caching statistics and anomaly masks between dashboard reruns.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from analysis.episodes import EpisodeIndex
+from analysis.profiling import note_cache, profiled
+from analysis.shared import freeze
+from analysis.stats import ColumnStats, _float_values, _numeric_cols, calculate_stats, detect_anomalies
+from data.store import PackedMask
+
+# parameters each detection method actually depends on
+METHOD_PARAMS = {
+    "IQR": ("iqr_factor",),
+    "z-score": ("z_thresh",),
+    "moving_avg": ("ma_window", "ma_pct"),
+    "rolling_mad": ("mad_window", "mad_thresh", "mad_seasonal"),
+    "grubbs": ("esd_max_outliers", "esd_alpha"),
+}
+
+
+@profiled("dataset_version")
+def dataset_version(df):
+    """
+    Content hash of a DataFrame (values, index and column names).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update("\x1f".join(map(str, df.columns)).encode())
+    return h.hexdigest()
+
+
+def _nbytes(value):
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    return int(getattr(value, "nbytes", 0))
+
+
+#-------------------
+# Bounded LRU cache
+#-------------------
+class AnalysisCache:
+    """
+    LRU cache bounded by total size of stored frames, with hit/miss counters.
+    Thread-safe, so one cache can be shared by all sessions on a data version:
+    stored values are frozen, and a key is computed once even when several
+    sessions miss it at the same time.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self._computing = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        # caller holds self._lock
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return True, self._items[key]
+        return False, None
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key)
+            if not found:
+                self.misses += 1
+        note_cache(found)
+        return value if found else default
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            found, value = self._lookup(key)
+            flight = None if found else self._computing.setdefault(key, threading.Lock())
+        if found:
+            note_cache(True)
+            return value
+
+        with flight:
+            with self._lock:
+                # another session may have computed it while this one waited
+                found, value = self._lookup(key)
+                if not found:
+                    self.misses += 1
+            note_cache(found)
+            if not found:
+                value = compute()
+                self.put(key, value)
+            with self._lock:
+                self._computing.pop(key, None)
+        return value
+
+    def put(self, key, value):
+        freeze(value)
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._items:
+                self.bytes -= self._sizes.pop(key)
+                del self._items[key]
+            self._items[key] = value
+            self._sizes[key] = size
+            self.bytes += size
+
+            # evict least recently used, always keep the newest item
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                old_key, _ = self._items.popitem(last=False)
+                self.bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def info(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._items),
+                "bytes": self.bytes,
+                "evictions": self.evictions,
+            }
+
+    @property
+    def nbytes(self):
+        return self.bytes
+
+    def __len__(self):
+        return len(self._items)
+
+
+#-----------------------
+# Cached analysis calls
+#-----------------------
+@profiled("cached_column_stats")
+def cached_column_stats(df, cache, version=None):
+    """
+    One ColumnStats per dataset version, shared by stats table and detectors.
+    """
+    version = version or dataset_version(df)
+    return cache.get_or_compute(("column_stats", version), lambda: ColumnStats.from_frame(df))
+
+
+@profiled("cached_stats")
+def cached_stats(df, cache, version=None):
+    """
+    calculate_stats keyed by dataset version.
+    """
+    version = version or dataset_version(df)
+    return cache.get_or_compute(
+        ("stats", version),
+        lambda: calculate_stats(df, col_stats=cached_column_stats(df, cache, version)),
+    )
+
+
+def _method_masks(df, cache, methods, version, **params):
+    """
+    {method: PackedMask}, each cached under the parameters that method uses.
+    """
+    masks = {}
+    for method in methods:
+        method_params = {p: params[p] for p in METHOD_PARAMS.get(method, ()) if p in params}
+        key = ("anomalies", version, method, tuple(sorted(method_params.items())))
+        masks[method] = cache.get_or_compute(
+            key, lambda m=method, mp=method_params: PackedMask.from_frame(detect_anomalies(
+                df, methods=[m], col_stats=cached_column_stats(df, cache, version), **mp
+            ))
+        )
+    return masks
+
+
+@profiled("cached_anomalies")
+def cached_anomalies(df, cache, methods, version=None, **params):
+    """
+    detect_anomalies with one cached mask per method. Key holds only the
+    parameters that method uses, so changing e.g. z_thresh recomputes z-score only.
+    Masks are cached bit-packed (1 bit per cell) and combined before unpacking.
+    """
+    version = version or dataset_version(df)
+    combined = None
+    for mask in _method_masks(df, cache, methods, version, **params).values():
+        # OR builds new bits, so cached masks are never modified
+        combined = mask if combined is None else combined | mask
+
+    if combined is None:
+        return detect_anomalies(df, methods=[])
+    return combined.to_frame()
+
+
+@profiled("cached_episodes")
+def cached_episodes(df, cache, methods, version=None, **params):
+    """
+    EpisodeIndex of the combined masks of methods (which method fired per episode),
+    cached per dataset version and method parameters.
+    """
+    version = version or dataset_version(df)
+    used = tuple((m, tuple(sorted((p, params[p]) for p in METHOD_PARAMS.get(m, ()) if p in params)))
+                 for m in methods)
+
+    def build():
+        masks = _method_masks(df, cache, methods, version, **params)
+        columns = _numeric_cols(df)
+        values = _float_values(df, columns)
+        return EpisodeIndex.from_masks(df["Date"], {m: mask.to_array() for m, mask in masks.items()},
+                                       values, columns)
+
+    return cache.get_or_compute(("episodes", version, used), build)
@@ -0,0 +1,116 @@
+"""
+Script used for recomputing only the dashboard stages whose inputs changed.
+
+Each stage declares the stages and parameters it reads. A stage result is kept
+together with the key of its inputs (input stage versions + parameter values);
+on the next run it is recomputed only if that key changed. A stage's version
+changes when it recomputes - or, with a fingerprint, only when its output does,
+so e.g. re-loading unchanged data does not invalidate stats and masks.
+"""
+
+import json
+
+from analysis.profiling import note_cache, span
+
+
+def _param_key(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class _Stage:
+    def __init__(self, name, func, inputs, params, fingerprint, incremental):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = tuple(params)
+        self.fingerprint = fingerprint
+        self.incremental = incremental
+
+
+class _Memo:
+    def __init__(self, key, value, version):
+        self.key = key
+        self.value = value
+        self.version = version
+
+
+#------------
+# Stage graph
+#------------
+class StageGraph:
+    """
+    Small DAG of memoized stages.
+    - memo: dict kept across runs (e.g. in st.session_state), so stage functions
+      can be redefined on every Streamlit rerun while results survive
+    """
+
+    def __init__(self, memo=None):
+        self.stages = {}
+        self.params = {}
+        self.memo = {} if memo is None else memo
+        self.recomputed = []
+        self._resolved = set()
+
+    def stage(self, name, inputs=(), params=(), fingerprint=None, incremental=False):
+        """
+        Decorator registering func(**inputs, **params) as stage `name`.
+        - fingerprint: output -> hashable version (default: new version on every recompute)
+        - incremental: func also receives previous=<last result or None>
+        """
+        def decorator(func):
+            for dep in inputs:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'.")
+            self.stages[name] = _Stage(name, func, inputs, params, fingerprint, incremental)
+            return func
+        return decorator
+
+    def set_params(self, **params):
+        """
+        Updates parameters (others keep their values) and starts a new run.
+        """
+        self.params.update(params)
+        self._resolved = set()
+
+    def get(self, name):
+        """
+        Result of stage `name`, recomputing it and its invalidated inputs as needed.
+        """
+        stage = self.stages[name]
+        memo = self.memo.get(name)
+        if name in self._resolved:
+            return memo.value
+
+        args = {}
+        key = []
+        for dep in stage.inputs:
+            args[dep] = self.get(dep)
+            key.append((dep, self.memo[dep].version))
+        for param in stage.params:
+            if param not in self.params:
+                raise KeyError(f"Stage '{name}' needs parameter '{param}'.")
+            args[param] = self.params[param]
+            key.append((param, _param_key(self.params[param])))
+        key = tuple(key)
+
+        if memo is not None and memo.key == key:
+            note_cache(True)
+        else:
+            note_cache(False)
+            if stage.incremental:
+                args["previous"] = memo.value if memo is not None else None
+            with span(f"stage:{name}"):
+                value = stage.func(**args)
+            if stage.fingerprint is not None:
+                version = stage.fingerprint(value)
+            else:
+                version = (memo.version + 1) if memo is not None and isinstance(memo.version, int) else 0
+            memo = self.memo[name] = _Memo(key, value, version)
+            self.recomputed.append(name)
+
+        self._resolved.add(name)
+        return memo.value
+
+    def version(self, name):
+        self.get(name)
+        return self.memo[name].version
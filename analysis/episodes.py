@@ -0,0 +1,288 @@
+"""
+Script used for indexing anomaly masks as per-mine episodes (runs of consecutive anomalous days).
+
+Each episode keeps its first/last row, peak (the value farthest from the mine's
+median) and the detection methods that fired inside it. Episodes of a mine are
+disjoint and sorted, so both their starts and their ends are sorted: date range
+queries and anomalous-day counts are binary searches plus a prefix sum of
+episode lengths, independent of how many days the range covers.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analysis.profiling import profiled
+from data.store import date_bounds
+
+
+def _runs(mask):
+    """
+    (column, first_row, last_row) of every run of True in a (rows, columns) mask,
+    ordered by column, then row.
+    """
+    n_rows, n_cols = mask.shape
+    padded = np.zeros((n_cols, n_rows + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask.T
+    edges = np.diff(padded, axis=1)
+    col, start = np.nonzero(edges == 1)
+    _, stop = np.nonzero(edges == -1)
+    return col, start, stop - 1
+
+
+def _segment_any(flat, begin, end):
+    """
+    any(flat[b:e]) for disjoint, increasing [b, e) segments of a flat boolean array.
+    """
+    if len(begin) == 0:
+        return np.zeros(0, dtype=bool)
+    bounds = np.empty(2 * len(begin), dtype=np.int64)
+    bounds[0::2] = begin
+    bounds[1::2] = end
+    # trailing False so a segment may end at the last element
+    return np.logical_or.reduceat(np.r_[flat, False], bounds)[0::2]
+
+
+#---------------
+# Episode index
+#---------------
+class EpisodeIndex:
+    """
+    Sparse index of anomaly episodes per mine (CSR layout: episodes of mine j are
+    offsets[j]:offsets[j + 1], sorted by start row).
+    """
+
+    def __init__(self, columns, dates, methods, offsets, start, end, peak_row, peak_value,
+                 peak_score, method_bits):
+        self.columns = list(columns)
+        self.dates = np.asarray(dates, dtype="datetime64[ns]")
+        self.methods = list(methods)
+        self.offsets = offsets
+        self.start = start
+        self.end = end
+        self.peak_row = peak_row
+        self.peak_value = peak_value
+        self.peak_score = peak_score
+        self.method_bits = method_bits
+        # anomalous days in episodes before episode i (over all mines)
+        self._cum_days = np.r_[0, np.cumsum(end - start + 1)]
+        self._col = {c: j for j, c in enumerate(self.columns)}
+
+    @classmethod
+    @profiled("episode_index")
+    def from_masks(cls, dates, masks, values=None, columns=None):
+        """
+        Index of the union of per-method masks.
+        - dates: sorted row dates
+        - masks: {method: (rows, columns) bool array or DataFrame}
+        - values: (rows, columns) data for episode peaks (None = no peaks)
+        """
+        methods = list(masks)
+        arrays = [np.asarray(m.to_numpy(dtype=bool) if isinstance(m, pd.DataFrame) else m, dtype=bool)
+                  for m in masks.values()]
+        if columns is None:
+            first = next(iter(masks.values()), None)
+            columns = list(first.columns) if isinstance(first, pd.DataFrame) else []
+        n_rows, n_cols = len(dates), len(columns)
+        combined = np.zeros((n_rows, n_cols), dtype=bool)
+        for arr in arrays:
+            combined |= arr
+
+        col, start, end = _runs(combined)
+        offsets = np.searchsorted(col, np.arange(n_cols + 1), side="left")
+
+        # which methods fired inside each episode (column-major flat positions)
+        begin = col.astype(np.int64) * n_rows + start
+        stop = col.astype(np.int64) * n_rows + end + 1
+        method_bits = np.zeros(len(start), dtype=np.uint32)
+        for bit, arr in enumerate(arrays):
+            if len(arrays) > 1:
+                fired = _segment_any(np.ascontiguousarray(arr.T).ravel(), begin, stop)
+            else:
+                fired = np.ones(len(start), dtype=bool)
+            method_bits |= fired.astype(np.uint32) << bit
+
+        peak_row, peak_value, peak_score = cls._peaks(values, col, start, end, n_rows)
+        return cls(columns, dates, methods, offsets, start.astype(np.int64), end.astype(np.int64),
+                   peak_row, peak_value, peak_score, method_bits)
+
+    @classmethod
+    def from_frame(cls, anomalies, df=None, method="anomaly"):
+        """
+        Index of a combined boolean anomaly frame (no per-method detail).
+        Dates and peak values come from df when given.
+        """
+        columns = list(anomalies.columns)
+        dates = df["Date"] if df is not None else np.arange(len(anomalies)).astype("datetime64[D]")
+        values = None
+        if df is not None and all(c in df.columns for c in columns):
+            values = df[columns].to_numpy(dtype=float)
+        return cls.from_masks(dates, {method: anomalies}, values, columns)
+
+    @staticmethod
+    def _peaks(values, col, start, end, n_rows):
+        """
+        Row, value and |value - column median| of each episode's most extreme day.
+        """
+        n = len(start)
+        if values is None or n == 0:
+            return start.astype(np.int64), np.full(n, np.nan), np.full(n, np.nan)
+
+        values = np.asarray(values)
+        lengths = end - start + 1
+        # every anomalous cell, grouped by episode
+        first_cell = np.r_[0, np.cumsum(lengths)[:-1]]
+        episode = np.repeat(np.arange(n), lengths)
+        rows = np.repeat(start, lengths) + (np.arange(lengths.sum()) - np.repeat(first_cell, lengths))
+        cells = values[rows, col[episode]].astype(float)
+
+        with np.errstate(all="ignore"):
+            median = np.nanmedian(values, axis=0) if len(values) else np.zeros(values.shape[1])
+        score = np.abs(cells - median[col[episode]])
+        score = np.where(np.isfinite(score), score, -np.inf)
+        best = np.maximum.reduceat(score, first_cell)
+        # first cell reaching the episode maximum
+        hit = np.flatnonzero(score == best[episode])
+        _, first_hit = np.unique(episode[hit], return_index=True)
+        peak_cell = hit[first_hit]
+        return rows[peak_cell], cells[peak_cell], np.where(np.isfinite(best), best, np.nan)
+
+    #---------
+    # Queries
+    #---------
+    def _bounds(self, start=None, end=None):
+        return date_bounds(self.dates, start, end)
+
+    def _episode_range(self, j, lo, hi):
+        """
+        Episodes of column j overlapping rows [lo, hi): [a, b) into the flat arrays.
+        """
+        o0, o1 = self.offsets[j], self.offsets[j + 1]
+        a = o0 + np.searchsorted(self.end[o0:o1], lo, side="left")
+        b = o0 + np.searchsorted(self.start[o0:o1], hi, side="left")
+        return int(a), int(max(a, b))
+
+    def _cumulative(self, j, rows):
+        """
+        Anomalous days of column j in rows [0, r) for each r in rows.
+        """
+        o0, o1 = self.offsets[j], self.offsets[j + 1]
+        rows = np.asarray(rows, dtype=np.int64)
+        if o1 == o0:
+            return np.zeros(len(rows), dtype=np.int64)
+        k = o0 + np.searchsorted(self.start[o0:o1], rows, side="left")
+        days = self._cum_days[k] - self._cum_days[o0]
+        # the last episode starting before r may run past it
+        last = k - 1
+        has_last = last >= o0
+        overshoot = np.where(has_last, self.end[np.maximum(last, 0)] + 1 - rows, 0)
+        return days - np.clip(overshoot, 0, None)
+
+    def _select(self, mines):
+        return self.columns if mines is None else [m for m in mines if m in self._col]
+
+    def cumulative(self, rows, mines=None):
+        """
+        (len(rows), mines) anomalous days before each row position, e.g. for period
+        counts as differences at period boundaries.
+        """
+        mines = self._select(mines)
+        out = np.zeros((len(rows), len(mines)), dtype=np.int64)
+        for i, m in enumerate(mines):
+            out[:, i] = self._cumulative(self._col[m], rows)
+        return out
+
+    def day_counts(self, start=None, end=None, mines=None):
+        """
+        Anomalous days per mine with start <= Date <= end.
+        """
+        lo, hi = self._bounds(start, end)
+        mines = self._select(mines)
+        counts = self.cumulative([lo, hi], mines)
+        return pd.Series(counts[1] - counts[0], index=mines, dtype=np.int64)
+
+    def episode_counts(self, start=None, end=None, mines=None):
+        """
+        Episodes per mine overlapping [start, end].
+        """
+        lo, hi = self._bounds(start, end)
+        mines = self._select(mines)
+        counts = [np.subtract(*self._episode_range(self._col[m], lo, hi)[::-1]) for m in mines]
+        return pd.Series(counts, index=mines, dtype=np.int64)
+
+    def unique_days(self, start=None, end=None, mines=None):
+        """
+        Days with at least one anomalous mine in [start, end] (union of episodes).
+        """
+        lo, hi = self._bounds(start, end)
+        firsts, lasts = [], []
+        for m in self._select(mines):
+            a, b = self._episode_range(self._col[m], lo, hi)
+            firsts.append(self.start[a:b])
+            lasts.append(self.end[a:b])
+        if not firsts or not sum(len(f) for f in firsts):
+            return 0
+        first = np.clip(np.concatenate(firsts), lo, hi - 1)
+        last = np.clip(np.concatenate(lasts), lo, hi - 1)
+        order = np.argsort(first, kind="stable")
+        first, last = first[order], np.maximum.accumulate(last[order])
+        # a merged interval starts where the next start lies after everything so far
+        new = np.r_[True, first[1:] > last[:-1]]
+        group_last = np.r_[last[np.flatnonzero(new)[1:] - 1], last[-1]]
+        return int((group_last - first[new] + 1).sum())
+
+    def rows(self, mine, lo=0, hi=None):
+        """
+        Positional rows of anomalous days of mine within [lo, hi).
+        """
+        hi = len(self.dates) if hi is None else hi
+        if mine not in self._col:
+            return np.zeros(0, dtype=np.int64)
+        a, b = self._episode_range(self._col[mine], lo, hi)
+        if b == a:
+            return np.zeros(0, dtype=np.int64)
+        first = np.maximum(self.start[a:b], lo)
+        last = np.minimum(self.end[a:b], hi - 1)
+        lengths = last - first + 1
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+        return np.repeat(first - offsets, lengths) + np.arange(lengths.sum())
+
+    def mask(self, start=None, end=None, mines=None):
+        """
+        Dense boolean frame for rows in [start, end] (e.g. a chart's date window).
+        """
+        lo, hi = self._bounds(start, end)
+        mines = self._select(mines)
+        out = np.zeros((hi - lo, len(mines)), dtype=bool)
+        for i, m in enumerate(mines):
+            out[self.rows(m, lo, hi) - lo, i] = True
+        return pd.DataFrame(out, columns=mines)
+
+    def method_names(self, bits):
+        return [m for i, m in enumerate(self.methods) if bits >> i & 1]
+
+    def query(self, start=None, end=None, mines=None):
+        """
+        Episodes overlapping [start, end]: mine, start, end, days, peak date/value, methods.
+        """
+        lo, hi = self._bounds(start, end)
+        idx = [np.arange(*self._episode_range(self._col[m], lo, hi)) for m in self._select(mines)]
+        idx = np.concatenate(idx) if idx else np.zeros(0, dtype=np.int64)
+        col = np.searchsorted(self.offsets, idx, side="right") - 1
+        return pd.DataFrame({
+            "mine": [self.columns[j] for j in col],
+            "start": self.dates[self.start[idx]],
+            "end": self.dates[self.end[idx]],
+            "days": self.end[idx] - self.start[idx] + 1,
+            "peak_date": self.dates[self.peak_row[idx]],
+            "peak_value": self.peak_value[idx],
+            "peak_score": self.peak_score[idx],
+            "methods": [", ".join(self.method_names(b)) for b in self.method_bits[idx]],
+        })
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.offsets, self.start, self.end, self.peak_row, self.peak_value,
+                                      self.peak_score, self.method_bits, self._cum_days))
@@ -0,0 +1,162 @@
+"""
+Script used for scoring days across all mines jointly (fleet-wide event days).
+
+Each mine is robustly standardized (rolling median / MAD, optionally without its
+day-of-week profile), then every day gets the Mahalanobis distance of its vector of
+standardized values. The covariance comes from the preceding `cov_window` days and is
+updated block by block (cross-products of the day entering added, of the day leaving
+subtracted), so an event never inflates the covariance it is scored against.
+A day's score splits into per-mine contributions z_j * (S^-1 z)_j, which name the
+mines behind it.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import linalg
+from scipy import stats as sp_stats
+
+from analysis.profiling import profiled
+from analysis.stats import (MAD_SCALE, _fill_gaps, _float_values, _median_rows, _numeric_cols,
+                            _odd_window, weekday_factors)
+
+
+def _fleet_cols(df):
+    # Total is the sum of the mines, it would make the covariance singular
+    return [col for col in _numeric_cols(df) if col != "Total"]
+
+
+#-------------------------
+# Robust standardization
+#-------------------------
+def robust_zscores(values, window=91, dates=None, seasonal=True):
+    """
+    (days, mines) array of (x - rolling median) / (MAD_SCALE * rolling MAD).
+    Missing values get z = 0 (no evidence either way).
+    - window: days in the centered rolling window (made odd)
+    - dates, seasonal: divide out each mine's day-of-week profile first
+    """
+    T = np.array(np.asarray(values, dtype=float).T, order="C")
+    missing = ~np.isfinite(T)
+    T = _fill_gaps(T)
+    window = _odd_window(window)
+    if seasonal and dates is not None:
+        weekday = (np.asarray(dates, dtype="datetime64[D]").astype("int64") + 3) % 7
+        T /= weekday_factors(T, weekday, window)[:, weekday]
+
+    T -= _median_rows(T, window)
+    scale = _median_rows(np.abs(T), window)
+    scale *= MAD_SCALE
+    # flat windows: fall back to the mine's overall scale
+    overall = np.median(scale, axis=1, keepdims=True)
+    scale = np.where(scale > 0, scale, np.where(overall > 0, overall, 1.0))
+    T /= scale
+    T[missing] = 0.0
+    return T.T
+
+
+#-------------------
+# Mahalanobis score
+#-------------------
+def _precision_factor(gram, n_days, shrinkage, prior_days):
+    """
+    Cholesky factor of the covariance from a cross-product sum, shrunk towards its
+    diagonal (also keeps it invertible with fewer days than mines). prior_days of
+    identity covariance (what standardized values have without correlation) are
+    mixed in, so short histories do not produce extreme distances.
+    """
+    p = gram.shape[0]
+    cov = (gram + prior_days * np.eye(p)) / (n_days + prior_days)
+    diag = np.diag(cov).copy()
+    diag[diag <= 0] = 1.0
+    cov *= 1 - shrinkage
+    cov[np.diag_indices(p)] = diag + 1e-9
+    try:
+        return linalg.cho_factor(cov, check_finite=False)
+    except linalg.LinAlgError:
+        return linalg.cho_factor(np.diag(diag), check_finite=False)
+
+
+@profiled("fleet_scores")
+def fleet_scores(df, window=91, cov_window=180, refresh=30, shrinkage=0.2, clip=3.0, prior_days=30,
+                 seasonal=True, alpha=0.001, top_k=3, return_contributions=False):
+    """
+    Joint anomaly score of every day across all mines.
+    - window: rolling median / MAD window used to standardize each mine
+    - cov_window: days of history the covariance is estimated from
+    - refresh: days scored with one covariance estimate (one Cholesky per block)
+    - shrinkage: weight of the diagonal in the covariance, 0..1
+    - clip: standardized values are clipped to +-clip for the covariance only,
+      so outliers in the history do not hide later ones
+    - prior_days: weight (in days) of the identity covariance used before history builds up
+    - seasonal: remove day-of-week profiles before standardizing
+    - alpha: significance level for is_event (chi-square with one degree per mine)
+    - top_k: number of contributing mines reported per day
+    - return_contributions: also return (days, mines) DataFrame of contributions
+    Returns DataFrame with Date, score (squared distance), p_value, is_event,
+    top_mines (list of names) and top_share (share of score from top_mines).
+    """
+    columns = _fleet_cols(df)
+    n_days, p = len(df), len(columns)
+    dates = df["Date"] if "Date" in df.columns else None
+    Z = robust_zscores(_float_values(df, columns), window, dates, seasonal) if p and n_days else np.zeros((n_days, p))
+    Zc = np.clip(Z, -clip, clip)
+
+    refresh = max(1, int(refresh))
+    cov_window = max(refresh, int(cov_window))
+    contrib = np.zeros((n_days, p))
+    gram = np.zeros((p, p))
+    lo = 0
+    for start in range(0, n_days, refresh):
+        stop = min(start + refresh, n_days)
+        if p:
+            factor = _precision_factor(gram, start - lo, shrinkage, prior_days)
+            block = Z[start:stop]
+            solved = linalg.cho_solve(factor, block.T, check_finite=False).T
+            contrib[start:stop] = block * solved
+        # slide the history: add this block, drop days older than cov_window
+        gram += Zc[start:stop].T @ Zc[start:stop]
+        new_lo = max(0, stop - cov_window)
+        if new_lo > lo:
+            gram -= Zc[lo:new_lo].T @ Zc[lo:new_lo]
+            lo = new_lo
+    scores = contrib.sum(axis=1)
+
+    top_k = min(max(int(top_k), 0), p)
+    if top_k:
+        top = np.argpartition(-contrib, top_k - 1, axis=1)[:, :top_k]
+        top_contrib = np.take_along_axis(contrib, top, axis=1)
+        top = np.take_along_axis(top, np.argsort(-top_contrib, axis=1), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = np.where(scores > 0, top_contrib.sum(axis=1) / scores, np.nan)
+    else:
+        top = np.zeros((n_days, 0), dtype=int)
+        share = np.full(n_days, np.nan)
+    names = np.asarray(columns, dtype=object)
+
+    # estimated covariances and MAD scales inflate distances a little; rescaling so
+    # the median day sits at the chi-square median keeps p-values calibrated
+    dof = max(p, 1)
+    median = np.median(scores) if n_days else 0.0
+    calibration = sp_stats.chi2.median(dof) / median if median > 0 else 1.0
+    p_value = sp_stats.chi2.sf(scores * calibration, dof)
+    out = pd.DataFrame({
+        "score": scores,
+        "p_value": p_value,
+        "is_event": p_value < alpha,
+        "top_mines": [list(row) for row in names[top]],
+        "top_share": share,
+    }, index=df.index)
+    if dates is not None:
+        out.insert(0, "Date", dates)
+
+    if return_contributions:
+        return out, pd.DataFrame(contrib, index=df.index, columns=columns)
+    return out
+
+
+def fleet_event_days(scores, limit=None):
+    """
+    Event days sorted by score (highest first).
+    """
+    events = scores[scores["is_event"]].sort_values("score", ascending=False)
+    return events if limit is None else events.head(limit)
@@ -0,0 +1,188 @@
+"""
+Script used for forecasting every mine with a damped Holt-Winters model (weekly season).
+
+The generator multiplies a base level by exponential growth and day-of-week
+multipliers, so the model works on log values, where both are additive:
+level + damped trend + an offset per weekday. The recursion runs once over the days
+and updates all mines, for every candidate set of smoothing parameters, as arrays;
+each mine then uses the candidate with the smallest one-step-ahead error. New days
+continue the recursion from the stored state instead of refitting.
+"""
+
+import itertools
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import stats as sp_stats
+
+from analysis.profiling import profiled
+from analysis.stats import _float_values, _numeric_cols
+
+SEASON = 7
+# candidate smoothing weights: level (alpha), trend (beta), weekday offsets (gamma)
+DEFAULT_GRID = {"alpha": (0.05, 0.2, 0.5), "beta": (0.0, 0.005, 0.02), "gamma": (0.05, 0.2)}
+DAMPING = 0.98
+# days the initial fit runs over (older days barely affect the state)
+HISTORY_DAYS = 3 * 365
+
+
+def _weekdays(dates):
+    # 1970-01-01 was a Thursday -> Monday = 0
+    return (np.asarray(dates, dtype="datetime64[D]").astype("int64") + 3) % SEASON
+
+
+def _log_values(values):
+    """
+    log of values; zeros, negatives and NaNs become NaN (treated as missing days).
+    """
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(values > 0, np.log(values), np.nan)
+
+
+#-------------------
+# Holt-Winters model
+#-------------------
+class HoltWinters:
+    """
+    Damped additive Holt-Winters state of all mines (on log values) for every
+    candidate parameter set: level and trend (candidates, mines), weekday offsets
+    (candidates, 7, mines) indexed by weekday, and one-step squared errors.
+    """
+
+    def __init__(self, columns, grid=DEFAULT_GRID, damping=DAMPING):
+        combos = np.array(list(itertools.product(grid["alpha"], grid["beta"], grid["gamma"])))
+        self.columns = list(columns)
+        self.alpha, self.beta, self.gamma = (combos[:, i:i + 1] for i in range(3))
+        self.damping = damping
+        k, m = len(combos), len(self.columns)
+        self.level = np.zeros((k, m))
+        self.trend = np.zeros((k, m))
+        self.season = np.zeros((k, SEASON, m))
+        self.sse = np.zeros((k, m))
+        self.n_errors = np.zeros(m)
+        self.n_rows = 0
+        self.last_date = None
+        self._last_row = None
+
+    @classmethod
+    @profiled("forecast_fit")
+    def fit(cls, df, columns=None, history_days=HISTORY_DAYS, **kwargs):
+        """
+        Model fitted on the last history_days rows of df. The first two weeks set
+        the initial level and weekday offsets.
+        """
+        columns = _numeric_cols(df) if columns is None else list(columns)
+        model = cls(columns, **kwargs)
+        start = max(0, len(df) - history_days) if history_days else 0
+        head = df.iloc[start:start + 2 * SEASON]
+        model._initialize(_log_values(_float_values(head, columns)), _weekdays(head["Date"]))
+        model.n_rows = start
+        return model.update(df.iloc[start:])
+
+    def _initialize(self, Y, weekday):
+        # mines without finite values in the first weeks start from 0
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            level = np.nanmean(Y, axis=0) if len(Y) else np.zeros(len(self.columns))
+            level = np.where(np.isfinite(level), level, 0.0)
+            for w in range(SEASON):
+                rows = Y[weekday == w]
+                offset = np.nanmean(rows, axis=0) - level if len(rows) else np.zeros_like(level)
+                self.season[:, w, :] = np.where(np.isfinite(offset), offset, 0.0)
+        self.season -= self.season.mean(axis=1, keepdims=True)
+        self.level[:] = level
+
+    @profiled("forecast_update")
+    def update(self, df_new):
+        """
+        Continues the recursion over new rows (in place).
+        """
+        if len(df_new) == 0:
+            return self
+
+        Y = _log_values(_float_values(df_new, self.columns))
+        weekday = _weekdays(df_new["Date"])
+        phi = self.damping
+        level, trend, season, sse = self.level, self.trend, self.season, self.sse
+        for y, w in zip(Y, weekday):
+            observed = np.isfinite(y)
+            projected = level + phi * trend
+            error = np.where(observed, y - projected - season[:, w, :], 0.0)
+            season[:, w, :] += self.gamma * error
+            level[:] = projected + self.alpha * error
+            trend *= phi
+            trend += self.beta * error
+            sse += error * error
+            self.n_errors += observed
+
+        self.n_rows += len(df_new)
+        self.last_date = np.datetime64(df_new["Date"].iloc[-1], "ns")
+        self._last_row = df_new.iloc[[-1]].reset_index(drop=True)
+        return self
+
+    def extends(self, df):
+        """
+        True if df is this model's data plus appended rows (last known row unchanged).
+        """
+        if self._last_row is None or len(df) < self.n_rows or list(_numeric_cols(df)) != self.columns:
+            return False
+        return df.iloc[[self.n_rows - 1]].reset_index(drop=True).equals(self._last_row)
+
+    @property
+    def best(self):
+        """
+        Index of the parameter set with the smallest one-step error, per mine.
+        """
+        return np.argmin(self.sse, axis=0)
+
+    def forecast(self, days, level=0.95):
+        """
+        DataFrame of the next `days` days: Date, "<mine>" (median forecast) and
+        "<mine> lower" / "<mine> upper" (prediction interval at `level`).
+        """
+        days = max(int(days), 0) if self.last_date is not None else 0
+        mines = np.arange(len(self.columns))
+        best = self.best
+        alpha, beta, gamma = (p[best, 0] for p in (self.alpha, self.beta, self.gamma))
+        sigma = np.sqrt(self.sse[best, mines] / np.maximum(self.n_errors, 1))
+
+        phi = self.damping
+        steps = np.arange(1, days + 1)
+        # phi + phi^2 + ... + phi^h
+        damped = np.cumsum(phi ** steps)
+        dates = (self.last_date if self.last_date is not None else np.datetime64(0, "ns")) \
+            + steps.astype("timedelta64[D]")
+        weekday = _weekdays(dates)
+        mean = (self.level[best, mines] + damped[:, None] * self.trend[best, mines]
+                + self.season[best[None, :], weekday[:, None], mines[None, :]])
+
+        # variance after h steps: sigma^2 * (1 + sum_{j<h} c_j^2), c_j = alpha + beta*damped_j + gamma*[j % 7 == 0]
+        c = alpha + beta * damped[:-1, None] + gamma * (steps[:-1, None] % SEASON == 0) if days > 1 \
+            else np.zeros((0, len(mines)))
+        spread = sigma * np.sqrt(1 + np.r_[np.zeros((1, len(mines))), np.cumsum(c * c, axis=0)])[:days]
+        z = sp_stats.norm.ppf(0.5 + level / 2)
+
+        out = {"Date": dates.astype("datetime64[ns]")}
+        for j, col in enumerate(self.columns):
+            out[col] = np.exp(mean[:, j])
+            out[f"{col} lower"] = np.exp(mean[:, j] - z * spread[:, j])
+            out[f"{col} upper"] = np.exp(mean[:, j] + z * spread[:, j])
+        return pd.DataFrame(out)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.level, self.trend, self.season, self.sse, self.n_errors))
+
+
+def update_forecaster(model, df, history_days=HISTORY_DAYS):
+    """
+    Model for df: advanced in place over the new rows when df only appended days,
+    refitted otherwise.
+    """
+    if model is not None and model.extends(df):
+        if len(df) > model.n_rows:
+            model.update(df.iloc[model.n_rows:])
+        return model
+    return HoltWinters.fit(df, history_days=history_days)
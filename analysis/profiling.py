@@ -0,0 +1,248 @@
+"""
+Script used for timing pipeline stages (wall time, rows/columns, memory delta, cache hits).
+
+Spans are recorded only while a Profiler is active (activate()), otherwise
+span() and profiled() cost a context-variable lookup.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+_active = ContextVar("wy_profiler", default=None)
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def _rss_bytes():
+    """
+    Current resident set size (Linux /proc), None where unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+#------
+# Spans
+#------
+class Span:
+    """
+    One timed stage. rows/cols/meta can be filled in while the stage runs.
+    """
+
+    def __init__(self, name, depth=0, rows=None, cols=None, meta=None):
+        self.name = name
+        self.depth = depth
+        self.rows = rows
+        self.cols = cols
+        self.meta = meta or {}
+        self.started_at = time.time()
+        self.seconds = None
+        self.memory_delta = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def cache(self):
+        if not self.cache_hits and not self.cache_misses:
+            return None
+        if not self.cache_misses:
+            return "hit"
+        if not self.cache_hits:
+            return "miss"
+        return f"{self.cache_hits} hit / {self.cache_misses} miss"
+
+    def to_dict(self):
+        return {
+            "stage": self.name, "depth": self.depth, "started_at": self.started_at,
+            "seconds": self.seconds, "rows": self.rows, "cols": self.cols,
+            "memory_delta_bytes": self.memory_delta, "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses, **self.meta,
+        }
+
+
+class Profiler:
+    """
+    Collects spans of one run (a dashboard rerun, a report job), in start order.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._stack = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, rows=None, cols=None, **meta):
+        sp = Span(name, len(self._stack), rows, cols, meta)
+        with self._lock:
+            self.spans.append(sp)
+        self._stack.append(sp)
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            yield sp
+        finally:
+            sp.seconds = time.perf_counter() - t0
+            rss_after = _rss_bytes()
+            if rss_before is not None and rss_after is not None:
+                sp.memory_delta = rss_after - rss_before
+            self._stack.pop()
+
+    def note_cache(self, hit):
+        if self._stack:
+            if hit:
+                self._stack[-1].cache_hits += 1
+            else:
+                self._stack[-1].cache_misses += 1
+
+    @property
+    def total_seconds(self):
+        return sum(sp.seconds or 0.0 for sp in self.spans if sp.depth == 0)
+
+    def summary(self):
+        """
+        Per-stage totals: calls, seconds, last rows/cols, memory delta, cache hits/misses.
+        """
+        stages = {}
+        for sp in self.spans:
+            st = stages.setdefault(sp.name, {
+                "stage": sp.name, "calls": 0, "seconds": 0.0, "rows": None, "cols": None,
+                "memory_delta_bytes": 0, "cache_hits": 0, "cache_misses": 0,
+            })
+            st["calls"] += 1
+            st["seconds"] += sp.seconds or 0.0
+            st["rows"] = sp.rows if sp.rows is not None else st["rows"]
+            st["cols"] = sp.cols if sp.cols is not None else st["cols"]
+            st["memory_delta_bytes"] += sp.memory_delta or 0
+            st["cache_hits"] += sp.cache_hits
+            st["cache_misses"] += sp.cache_misses
+        return list(stages.values())
+
+    def frame(self):
+        """
+        Spans as a table for the dashboard panel (stage names indented by nesting).
+        """
+        return pd.DataFrame([{
+            "stage": "  " * sp.depth + sp.name,
+            "ms": None if sp.seconds is None else round(sp.seconds * 1000, 1),
+            "rows": sp.rows,
+            "cols": sp.cols,
+            "memory Δ MB": None if sp.memory_delta is None else round(sp.memory_delta / 1024 ** 2, 2),
+            "cache": sp.cache,
+        } for sp in self.spans])
+
+    def to_json(self):
+        return json.dumps({
+            "total_seconds": self.total_seconds,
+            "spans": [sp.to_dict() for sp in self.spans],
+            "summary": self.summary(),
+        }, indent=2, default=str)
+
+    def to_prometheus(self, prefix="wy_pipeline"):
+        """
+        Stage summary in Prometheus text exposition format.
+        """
+        metrics = [
+            ("stage_seconds_total", "counter", "Wall time spent in stage.", "seconds"),
+            ("stage_calls_total", "counter", "Number of times stage ran.", "calls"),
+            ("stage_rows", "gauge", "Rows processed by last run of stage.", "rows"),
+            ("stage_columns", "gauge", "Columns processed by last run of stage.", "cols"),
+            ("stage_memory_delta_bytes", "gauge", "Resident memory change during stage.", "memory_delta_bytes"),
+            ("stage_cache_hits_total", "counter", "Analysis cache hits inside stage.", "cache_hits"),
+            ("stage_cache_misses_total", "counter", "Analysis cache misses inside stage.", "cache_misses"),
+        ]
+        summary = self.summary()
+        lines = []
+        for name, kind, help_text, field in metrics:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for st in summary:
+                if st[field] is None:
+                    continue
+                stage = st["stage"].replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                lines.append(f'{prefix}_{name}{{stage="{stage}"}} {st[field]}')
+        return "\n".join(lines) + "\n"
+
+
+#--------------------
+# Active profiler API
+#--------------------
+def activate(profiler):
+    """
+    Makes profiler receive spans in the current thread/context. Returns token for deactivate().
+    """
+    return _active.set(profiler)
+
+
+def deactivate(token):
+    _active.reset(token)
+
+
+def current_profiler():
+    return _active.get()
+
+
+@contextmanager
+def span(name, rows=None, cols=None, **meta):
+    """
+    Times a block when a profiler is active; yields a Span either way.
+    """
+    profiler = _active.get()
+    if profiler is None:
+        yield Span(name, rows=rows, cols=cols)
+        return
+    with profiler.span(name, rows, cols, **meta) as sp:
+        yield sp
+
+
+def note_cache(hit):
+    """
+    Counts a cache hit/miss on the innermost active span.
+    """
+    profiler = _active.get()
+    if profiler is not None:
+        profiler.note_cache(hit)
+
+
+def _shape(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, list):
+        return len(value), None
+    shape = getattr(value, "shape", None)
+    if shape is None or len(shape) == 0:
+        return None, None
+    return shape[0], (shape[1] if len(shape) > 1 else 1)
+
+
+def profiled(name):
+    """
+    Decorator timing every call as a span. Rows/cols are taken from the first
+    DataFrame argument, or from the result when there is none.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None:
+                return func(*args, **kwargs)
+            frame = next((a for a in (*args, *kwargs.values()) if isinstance(a, pd.DataFrame)), None)
+            rows, cols = _shape(frame)
+            with span(name, rows, cols) as sp:
+                result = func(*args, **kwargs)
+                if frame is None:
+                    sp.rows, sp.cols = _shape(result)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,217 @@
+"""
+Script used for weekly/monthly/quarterly rollups of mine data for long date ranges.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analysis.profiling import profiled
+from analysis.stats import _float_values, _numeric_cols
+from data.store import date_bounds
+
+RESOLUTIONS = ("daily", "weekly", "monthly", "quarterly")
+ROLLUP_RESOLUTIONS = ("weekly", "monthly", "quarterly")
+AGGREGATES = ("mean", "sum", "min", "max")
+
+# average period length in days, used to pick a resolution for a date range
+_PERIOD_DAYS = {"daily": 1.0, "weekly": 7.0, "monthly": 30.44, "quarterly": 91.31}
+DEFAULT_MAX_PERIODS = 1000
+
+
+def period_starts(dates, resolution):
+    """
+    Start date of the week (Monday), month or quarter of each date.
+    """
+    days = np.asarray(dates, dtype="datetime64[D]")
+    if resolution == "daily":
+        starts = days
+    elif resolution == "weekly":
+        # 1970-01-01 was a Thursday -> Monday = 0
+        starts = days - (days.astype("int64") + 3) % 7
+    else:
+        months = days.astype("datetime64[M]")
+        if resolution == "quarterly":
+            m = months.astype("int64")
+            months = (m - m % 3).astype("datetime64[M]")
+        starts = months.astype("datetime64[D]")
+    return starts.astype("datetime64[ns]")
+
+
+def choose_resolution(start, end, max_periods=DEFAULT_MAX_PERIODS):
+    """
+    Finest resolution with at most max_periods points in [start, end].
+    """
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for resolution in RESOLUTIONS:
+        if days / _PERIOD_DAYS[resolution] <= max_periods:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def _aggregate(X, starts, row_offset=0):
+    """
+    Sum, count, min and max per run of equal period starts (rows sorted by date).
+    """
+    first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    finite = np.isfinite(X)
+    with np.errstate(invalid="ignore"):
+        return {
+            "starts": starts[first],
+            "first_row": first + row_offset,
+            "sum": np.add.reduceat(np.where(finite, X, 0), first, axis=0, dtype=np.float64),
+            "count": np.add.reduceat(finite, first, axis=0, dtype=np.int64),
+            "min": np.fmin.reduceat(X, first, axis=0),
+            "max": np.fmax.reduceat(X, first, axis=0),
+        }
+
+
+def _coarsen(level, resolution):
+    """
+    Aggregates of a resolution whose periods are unions of level's periods.
+    """
+    starts = period_starts(level["starts"], resolution)
+    first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    return {
+        "starts": starts[first],
+        "first_row": level["first_row"][first],
+        "sum": np.add.reduceat(level["sum"], first, axis=0),
+        "count": np.add.reduceat(level["count"], first, axis=0),
+        "min": np.fmin.reduceat(level["min"], first, axis=0),
+        "max": np.fmax.reduceat(level["max"], first, axis=0),
+    }
+
+
+def _levels(X, dates, resolutions, row_offset=0):
+    """
+    All resolutions from one pass over the rows: days are aggregated into segments
+    that lie inside one period of every resolution (e.g. week-within-month),
+    which are then combined per resolution.
+    """
+    # a segment starts where any period starts, i.e. at the latest of the period starts
+    segments = np.maximum.reduce([period_starts(dates, res) for res in resolutions])
+    base = _aggregate(X, segments, row_offset)
+    return {res: _coarsen(base, res) for res in resolutions}
+
+
+#-------------
+# Rollup cube
+#-------------
+class RollupCube:
+    """
+    Per-resolution sum/count/min/max of every mine column. New days are folded
+    into the last (partial) period and appended, without touching older periods.
+    Anomaly counts are read from the current mask, since detector masks change
+    when data or parameters change.
+    """
+
+    def __init__(self, columns, levels, n_rows, last_row):
+        self.columns = list(columns)
+        self.levels = levels
+        self.n_rows = n_rows
+        self._last_row = last_row
+
+    @classmethod
+    def build(cls, df, columns=None, resolutions=ROLLUP_RESOLUTIONS):
+        columns = _numeric_cols(df) if columns is None else list(columns)
+        levels = _levels(_float_values(df, columns), df["Date"], resolutions)
+        return cls(columns, levels, len(df), cls._row_key(df))
+
+    @staticmethod
+    def _row_key(df):
+        return None if len(df) == 0 else df.iloc[[-1]].reset_index(drop=True)
+
+    def update(self, df_new):
+        """
+        Folds rows dated on/after the last row into the cube (in place).
+        """
+        if len(df_new) == 0:
+            return self
+
+        new_levels = _levels(_float_values(df_new, self.columns), df_new["Date"], list(self.levels), self.n_rows)
+        for res, level in self.levels.items():
+            new = new_levels[res]
+            if len(level["starts"]) and new["starts"][0] == level["starts"][-1]:
+                # first new period continues the last stored one
+                level["sum"][-1] += new["sum"][0]
+                level["count"][-1] += new["count"][0]
+                level["min"][-1] = np.fmin(level["min"][-1], new["min"][0])
+                level["max"][-1] = np.fmax(level["max"][-1], new["max"][0])
+                new = {key: values[1:] for key, values in new.items()}
+            for key in level:
+                level[key] = np.concatenate([level[key], new[key]])
+
+        self.n_rows += len(df_new)
+        self._last_row = self._row_key(df_new)
+        return self
+
+    def extends(self, df):
+        """
+        True if df is this cube's data plus appended rows (same check as the
+        loader's overlap row: the last known row is unchanged).
+        """
+        if len(df) < self.n_rows or self.n_rows == 0 or list(_numeric_cols(df)) != self.columns:
+            return False
+        return df.iloc[[self.n_rows - 1]].reset_index(drop=True).equals(self._last_row)
+
+    def _bounds(self, resolution, start, end):
+        starts = self.levels[resolution]["starts"]
+        lo, hi = date_bounds(starts, start, end)
+        # the period containing `start` is included even if it begins earlier
+        if start is not None and lo > 0:
+            if lo == len(starts) or starts[lo] > np.datetime64(pd.Timestamp(start), "ns"):
+                lo -= 1
+        return lo, max(hi, lo)
+
+    def frame(self, resolution, agg="mean", start=None, end=None):
+        """
+        Date (period start) + one column per mine for periods overlapping [start, end].
+        """
+        level = self.levels[resolution]
+        lo, hi = self._bounds(resolution, start, end)
+        if agg == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = level["sum"][lo:hi] / level["count"][lo:hi]
+        elif agg == "sum":
+            values = np.where(level["count"][lo:hi] > 0, level["sum"][lo:hi], np.nan)
+        else:
+            values = level[agg][lo:hi]
+        out = pd.DataFrame(values, columns=self.columns)
+        out.insert(0, "Date", level["starts"][lo:hi])
+        return out
+
+    def anomaly_counts(self, anomalies, resolution, start=None, end=None):
+        """
+        Anomalous days per period and mine for a mask aligned with the cube's rows,
+        or an EpisodeIndex (differences of its running day counts at period starts).
+        """
+        level = self.levels[resolution]
+        lo, hi = self._bounds(resolution, start, end)
+        counts = np.zeros((hi - lo, len(self.columns)), dtype=np.int64)
+        if hi > lo:
+            first = level["first_row"][lo:hi]
+            stop = level["first_row"][hi] if hi < len(level["first_row"]) else self.n_rows
+            if hasattr(anomalies, "cumulative"):
+                counts[:] = np.diff(anomalies.cumulative(np.r_[first, stop], self.columns), axis=0)
+            else:
+                mask = anomalies[self.columns].iloc[first[0]:stop].to_numpy(dtype=bool)
+                counts[:] = np.add.reduceat(mask, first - first[0], axis=0, dtype=np.int64)
+        out = pd.DataFrame(counts, columns=self.columns)
+        out.insert(0, "Date", level["starts"][lo:hi])
+        return out
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for level in self.levels.values() for values in level.values())
+
+
+@profiled("rollup_update")
+def update_rollup(cube, df):
+    """
+    Cube for df: extended in place with the new rows when df only appended days,
+    rebuilt otherwise.
+    """
+    if cube is not None and cube.extends(df):
+        if len(df) > cube.n_rows:
+            cube.update(df.iloc[cube.n_rows:])
+        return cube
+    return RollupCube.build(df)
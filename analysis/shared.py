@@ -0,0 +1,221 @@
+"""
+Script used for sharing datasets and analysis results between dashboard sessions.
+
+One SharedStore per process holds every data version once, however many sessions
+show it. Sessions acquire entries into named slots ("dataset", "analysis", ...);
+acquiring a new key into a slot releases the slot's previous key, and an entry is
+dropped as soon as no session holds it. Each entry is built by the first session
+that asks for it, while the others wait for that result instead of building their own.
+
+Shared values are frozen (numpy buffers made read-only) and sessions receive
+shallow pandas copies: with pandas Copy-on-Write, a write in one session copies
+the touched column instead of changing what every other session sees.
+"""
+
+import copy
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# sessions not seen for this long are treated as closed (Streamlit has no close hook)
+SESSION_TTL_SECONDS = 30 * 60
+
+
+def freeze(value):
+    """
+    Makes numpy buffers of value read-only (arrays, PackedMask/ColumnStats-like
+    objects, tuples/lists/dicts of them). Returns value.
+    """
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        # pandas >= 3 copies on write; arrays read out via to_numpy() are read-only views
+        pass
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            freeze(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            freeze(item)
+    elif hasattr(value, "__dict__"):
+        for item in vars(value).values():
+            if isinstance(item, np.ndarray):
+                item.setflags(write=False)
+    return value
+
+
+def session_view(value):
+    """
+    Per-session handle of a shared value: shallow copies of frames (copy-on-write),
+    deep copies of small mutable containers, frozen objects as they are.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        return tuple(session_view(item) for item in value)
+    if isinstance(value, (list, dict)):
+        return copy.deepcopy(value)
+    return value
+
+
+def value_nbytes(value):
+    """
+    Memory held by a value: frames and arrays, nbytes of other objects, sums of tuples/lists.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, (tuple, list)):
+        return sum(value_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(value_nbytes(item) for item in value.values())
+    return int(getattr(value, "nbytes", 0) or 0)
+
+
+class _Entry:
+    def __init__(self, value):
+        self.value = value
+        self.holders = set()
+        self.created_at = time.time()
+
+
+#--------------
+# Shared store
+#--------------
+class SharedStore:
+    """
+    Process-wide, reference-counted store of read-only values, keyed by e.g.
+    ("dataset", version). Thread-safe (Streamlit runs each session in its own thread).
+    """
+
+    def __init__(self, session_ttl=SESSION_TTL_SECONDS):
+        self.session_ttl = session_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._building = {}
+        self._slots = {}
+        self._seen = {}
+        self._private = {}
+        self.builds = 0
+        self.hits = 0
+
+    def acquire(self, session, slot, key, build):
+        """
+        Shared value for key, built once by the first session that needs it.
+        The session holds it in slot until it acquires another key there.
+        Returns the frozen shared value (wrap with session_view before handing it out).
+        """
+        self.touch(session)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return self._hit(session, slot, key, entry)
+            flight = self._building.setdefault(key, threading.Lock())
+
+        # one build per key: later sessions wait here and then find the entry
+        with flight:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    return self._hit(session, slot, key, entry)
+            value = freeze(build())
+            with self._lock:
+                # published before the flight lock is released, so no waiter builds again
+                entry = self._entries.setdefault(key, _Entry(value))
+                self.builds += 1
+                self._hold(session, slot, key)
+                self._building.pop(key, None)
+            return entry.value
+
+    def _hit(self, session, slot, key, entry):
+        self.hits += 1
+        self._hold(session, slot, key)
+        return entry.value
+
+    def _hold(self, session, slot, key):
+        slots = self._slots.setdefault(session, {})
+        previous = slots.get(slot)
+        slots[slot] = key
+        self._entries[key].holders.add((session, slot))
+        if previous is not None and previous != key:
+            self._drop(session, slot, previous)
+
+    def _drop(self, session, slot, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.holders.discard((session, slot))
+        if not entry.holders:
+            del self._entries[key]
+
+    def release(self, session, slot):
+        with self._lock:
+            key = self._slots.get(session, {}).pop(slot, None)
+            if key is not None:
+                self._drop(session, slot, key)
+
+    def release_session(self, session):
+        with self._lock:
+            self._release_session(session)
+
+    def _release_session(self, session):
+        for slot, key in self._slots.pop(session, {}).items():
+            self._drop(session, slot, key)
+        self._seen.pop(session, None)
+        self._private.pop(session, None)
+
+    def touch(self, session, private_bytes=None):
+        """
+        Marks session as alive (optionally recording memory it holds outside the
+        store) and releases sessions idle for longer than session_ttl.
+        """
+        now = time.time()
+        with self._lock:
+            self._seen[session] = now
+            if private_bytes is not None:
+                self._private[session] = int(private_bytes)
+            for other, seen in list(self._seen.items()):
+                if now - seen > self.session_ttl:
+                    self._release_session(other)
+
+    #------------
+    # Reporting
+    #------------
+    def info(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            sessions = len(self._seen)
+        return {
+            "entries": len(entries),
+            "bytes": sum(value_nbytes(e.value) for e in entries),
+            "sessions": sessions,
+            "builds": self.builds,
+            "hits": self.hits,
+        }
+
+    def session_report(self):
+        """
+        Memory per session: shared bytes it references, its share of them
+        (each entry split evenly between its sessions) and private bytes.
+        """
+        with self._lock:
+            entries = {key: (e.value, {s for s, _ in e.holders}) for key, e in self._entries.items()}
+            slots = {s: dict(held) for s, held in self._slots.items()}
+            seen = dict(self._seen)
+            private = dict(self._private)
+
+        sizes = {key: value_nbytes(value) for key, (value, _) in entries.items()}
+        rows = []
+        for session in seen:
+            keys = {key for key in slots.get(session, {}).values() if key in entries}
+            rows.append({
+                "session": session[:8],
+                "slots": ", ".join(sorted(slots.get(session, {}))),
+                "shared MB": sum(sizes[k] for k in keys) / 1024 ** 2,
+                "attributed MB": sum(sizes[k] / len(entries[k][1]) for k in keys) / 1024 ** 2,
+                "private MB": private.get(session, 0) / 1024 ** 2,
+                "idle s": round(time.time() - seen[session]),
+            })
+        return pd.DataFrame(rows, columns=["session", "slots", "shared MB", "attributed MB",
+                                           "private MB", "idle s"])
@@ -2,45 +2,497 @@
 Script used for calculating stats and detecting anomalies from data.
 """
 
+import warnings
+
 import pandas as pd
 import numpy as np
+from functools import lru_cache
+from scipy import ndimage
 from scipy import stats as sp_stats
 
-#---------------------
-# Calculate statistics
-#---------------------
-def calculate_stats(df):
+from analysis.profiling import profiled, span
+
+#--------------------------
+# Shared column statistics
+#--------------------------
+def _numeric_cols(df):
     """
-    Calculating statistics used on dashboard. Total counted separately.
+    Mine columns (plus Total) used by stats and detectors.
     """
-    mine_cols = [
+    cols = [
         col for col in df.columns
         if col not in ["Date"] and "Randomizer" not in col and pd.api.types.is_numeric_dtype(df[col])
     ]
+    if "Total" in df.columns and "Total" not in cols:
+        cols.append("Total")
+    return cols
+
+
+def _float_values(df, columns):
+    """
+    2D array of columns, kept float32 when all of them are (compact frames), else float64.
+    """
+    if all(df[col].dtype == np.float32 for col in columns) and columns:
+        return df[columns].to_numpy(dtype=np.float32)
+    return df[columns].to_numpy(dtype=float, na_value=np.nan)
+
+
+class ColumnStats:
+    """
+    Per-column count, mean, M2 and sorted values, built in one sort pass per column.
+    Quantiles/median are read from the sorted values (same linear interpolation as pandas),
+    mean/std from count/mean/M2. Shared by calculate_stats and detect_anomalies, and
+    mergeable: appending days merges the new sorted block and combines moments
+    (Chan et al.) without rescanning old rows. Holds one sorted copy of the data.
+    """
+
+    def __init__(self, columns, count, mean, m2, sorted_values=None, values=None):
+        self.columns = list(columns)
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self._sorted = sorted_values
+        self._values = values
+
+    @classmethod
+    def from_frame(cls, df, columns=None):
+        columns = _numeric_cols(df) if columns is None else list(columns)
+        X = _float_values(df, columns)
+        count = np.isfinite(X).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # moments accumulated in float64 even for float32 data
+            mean = np.nansum(X, axis=0, dtype=np.float64) / count
+            m2 = np.nansum((X - mean) ** 2, axis=0)
+        return cls(columns, count, mean, m2, values=X)
+
+    @property
+    def sorted(self):
+        """
+        Column-wise sorted values (NaNs last), sorted on first quantile request.
+        """
+        sorted_values = self._sorted
+        if sorted_values is None:
+            values = self._values
+            if values is None:
+                # sorted meanwhile by another thread sharing this object
+                return self._sorted
+            sorted_values = np.sort(values, axis=0)
+            self._sorted = sorted_values
+            self._values = None
+        return sorted_values
+
+    def merge(self, other):
+        """
+        Combined stats of two disjoint row sets with the same columns.
+        """
+        if other.columns != self.columns:
+            raise ValueError("Cannot merge ColumnStats with different columns.")
+
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = other.mean - self.mean
+            mean = np.where(other.count == 0, self.mean,
+                            np.where(self.count == 0, other.mean,
+                                     self.mean + delta * other.count / count))
+            m2 = (np.nan_to_num(self.m2) + np.nan_to_num(other.m2)
+                  + np.nan_to_num(delta ** 2 * self.count * other.count / count))
+
+        # both blocks are sorted runs, a stable sort merges them in ~linear time
+        merged = np.sort(np.concatenate([self.sorted, other.sorted]), axis=0, kind="stable")
+        return ColumnStats(self.columns, count, mean, m2, merged)
+
+    def append(self, df_new):
+        return self.merge(ColumnStats.from_frame(df_new, self.columns))
+
+    def quantile(self, q):
+        """
+        Per-column quantile, linear interpolation (pandas default).
+        """
+        if len(self.sorted) == 0:
+            return np.full(len(self.columns), np.nan)
+
+        cols = np.arange(len(self.columns))
+        last = np.maximum(self.count - 1, 0)
+        pos = q * last
+        lo = np.floor(pos).astype(int)
+        hi = np.minimum(lo + 1, last)
+        out = self.sorted[lo, cols] + (pos - lo) * (self.sorted[hi, cols] - self.sorted[lo, cols])
+        return np.where(self.count > 0, out, np.nan)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def std(self, ddof=1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > ddof, np.sqrt(self.m2 / (self.count - ddof)), np.nan)
+
+    def series(self, values):
+        return pd.Series(values, index=self.columns)
+
+    @property
+    def nbytes(self):
+        data = self._sorted if self._sorted is not None else self._values
+        return data.nbytes + 3 * 8 * len(self.columns)
 
-    if "Total" in df.columns and "Total" not in mine_cols:
-        mine_cols.append("Total")
 
-    stats = pd.DataFrame(index=mine_cols)
-    stats["mean"] = df[mine_cols].mean()
-    stats["std"] = df[mine_cols].std()
-    stats["median"] = df[mine_cols].median()
-    stats["IQR"] = df[mine_cols].quantile(0.75) - df[mine_cols].quantile(0.25)
+#---------------------
+# Calculate statistics
+#---------------------
+@profiled("calculate_stats")
+def calculate_stats(df, col_stats=None):
+    """
+    Calculating statistics used on dashboard. Total counted separately.
+    - col_stats: precomputed ColumnStats for df (computed here if missing)
+    """
+    if col_stats is None:
+        col_stats = ColumnStats.from_frame(df)
+
+    stats = pd.DataFrame(index=col_stats.columns)
+    stats["mean"] = col_stats.mean
+    stats["std"] = col_stats.std()
+    stats["median"] = col_stats.median()
+    stats["IQR"] = col_stats.quantile(0.75) - col_stats.quantile(0.25)
 
     stats = stats.dropna(axis=0, how="all")
 
     return stats
 
 
+#------------------------------------
+# Generalized ESD (Rosner) / Grubbs
+#------------------------------------
+@lru_cache(maxsize=512)
+def _esd_critical_values(n, max_outliers, alpha):
+    """
+    Rosner critical values lambda_1..lambda_k for sample size n.
+    Steps that are not defined for n (i > n - 2) get +inf so they never fire.
+    """
+    lam = np.full(max_outliers, np.inf)
+    k = min(max_outliers, n - 2)
+    if k >= 1:
+        i = np.arange(1, k + 1)
+        p = 1 - alpha / (2 * (n - i + 1))
+        t = sp_stats.t.ppf(p, n - i - 1)
+        lam[:k] = (n - i) * t / np.sqrt((n - i - 1 + t ** 2) * (n - i + 1))
+    lam.setflags(write=False)
+    return lam
+
+
+# tail candidates kept per column and side, per allowed outlier (for normal data)
+_ESD_TAIL_PER_OUTLIER = 4
+_ESD_SAMPLE_ROWS = 4096
+# small enough for a chunk's temporaries to stay in the CPU cache
+_CHUNK_CELLS = 1 << 16
+
+
+def _row_chunks(n_rows, n_cols):
+    """
+    Row slices covering ~_CHUNK_CELLS cells each, so temporaries stay small.
+    """
+    step = max(1, _CHUNK_CELLS // max(n_cols, 1))
+    for start in range(0, n_rows, step):
+        yield slice(start, min(start + step, n_rows))
+
+
+def _k_extremes(X, counts, k, rows, cols, largest):
+    """
+    k smallest (ascending) or k largest (descending) finite values per column,
+    padded with +-inf. `rows`/`cols` are prefiltered tail candidates; columns with
+    too few of them fall back to np.partition over the full column.
+    """
+    n_rows, n_cols = X.shape
+    pad = -np.inf if largest else np.inf
+    out = np.full((k, n_cols), pad)
+
+    vals = X[rows, cols]
+    order = np.lexsort((-vals if largest else vals, cols))
+    cols, vals = cols[order], vals[order]
+    rank = np.arange(len(cols)) - np.searchsorted(cols, np.arange(n_cols))[cols]
+    keep = rank < k
+    out[rank[keep], cols[keep]] = vals[keep]
+
+    fallback = np.flatnonzero(np.bincount(cols, minlength=n_cols) < np.minimum(k, counts))
+    if len(fallback):
+        sub = X[:, fallback]
+        sub = np.where(np.isfinite(sub), sub, pad)
+        if largest:
+            part = -np.sort(-np.partition(sub, n_rows - k, axis=0)[n_rows - k:], axis=0)
+        else:
+            part = np.sort(np.partition(sub, k - 1, axis=0)[:k], axis=0)
+        out[:, fallback] = part
+
+    return out
+
+
+def generalized_esd(values, max_outliers=10, alpha=0.05):
+    """
+    Generalized ESD test run on all columns of 2D array at once (NaNs ignored).
+    With max_outliers=1 it is the classic two-sided Grubbs test.
+
+    The most extreme remaining value is always the current min or max, so only the
+    k smallest / k largest values per column are needed (taken from values beyond
+    3 sigma), and mean/std of remaining values are updated from running sums.
+    Cost is one chunked pass over the data plus O(k) vector steps.
+    Returns boolean mask with the same shape as values.
+    """
+    X = np.asarray(values, dtype=float)
+    squeeze = X.ndim == 1
+    if squeeze:
+        X = X[:, None]
+
+    n_rows, n_cols = X.shape
+    mask = np.zeros(X.shape, dtype=bool)
+    if n_rows < 3 or n_cols == 0:
+        return mask[:, 0] if squeeze else mask
+
+    # tail cuts around a sampled mean: any cut gives the same result (_k_extremes
+    # falls back to a full column when it keeps too few values), so sums and tail
+    # candidates come from one pass over the data
+    sample = X[::max(1, n_rows // _ESD_SAMPLE_ROWS)]
+    with warnings.catch_warnings(), np.errstate(invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        sample_mean = sample.mean(axis=0)
+        sample_std = sample.std(axis=0)
+        gaps = np.flatnonzero(~np.isfinite(sample_std))
+        if len(gaps):
+            sample_mean[gaps] = np.nanmean(sample[:, gaps], axis=0)
+            sample_std[gaps] = np.nanstd(sample[:, gaps], axis=0)
+    z = sp_stats.norm.isf(min(0.5, _ESD_TAIL_PER_OUTLIER * max_outliers / n_rows))
+    spread = np.where(np.isfinite(sample_std), z * sample_std, np.inf)
+
+    # sums relative to the sampled mean (shift keeps variance stable); columns
+    # that picked up NaN/inf are redone with masking
+    shift = np.where(np.isfinite(sample_mean), sample_mean, 0.0)
+    s1 = np.zeros(n_cols)
+    s2 = np.zeros(n_cols)
+    tail_rows, tail_cols = [], []
+    step = next(_row_chunks(n_rows, n_cols)).stop
+    dev_buf, abs_buf = np.empty((step, n_cols)), np.empty((step, n_cols))
+    for sl in _row_chunks(n_rows, n_cols):
+        dev = np.subtract(X[sl], shift, out=dev_buf[:sl.stop - sl.start])
+        s1 += dev.sum(axis=0)
+        s2 += np.einsum("ij,ij->j", dev, dev)
+        far = np.abs(dev, out=abs_buf[:len(dev)]) > spread
+        r, c = np.divmod(np.flatnonzero(far), n_cols)
+        tail_rows.append(r + sl.start)
+        tail_cols.append(c)
+
+    counts = np.full(n_cols, n_rows)
+    dirty = np.flatnonzero(~(np.isfinite(s1) & np.isfinite(s2)))
+    if len(dirty):
+        sub = X[:, dirty]
+        finite = np.isfinite(sub)
+        dev = np.where(finite, sub - shift[dirty], 0.0)
+        counts[dirty] = finite.sum(axis=0)
+        s1[dirty] = dev.sum(axis=0)
+        s2[dirty] = np.einsum("ij,ij->j", dev, dev)
+
+    k = int(min(max_outliers, counts.max() - 2))
+    if k < 1:
+        return mask[:, 0] if squeeze else mask
+
+    cnt = counts.astype(float)
+    tail_rows, tail_cols = np.concatenate(tail_rows), np.concatenate(tail_cols)
+    below = X[tail_rows, tail_cols] < shift[tail_cols]
+    low = _k_extremes(X, counts, k, tail_rows[below], tail_cols[below], largest=False)
+    high = _k_extremes(X, counts, k, tail_rows[~below], tail_cols[~below], largest=True)
+
+    # ESD steps: remove current min or max, whichever is further from the mean
+    cols = np.arange(n_cols)
+    lo_idx = np.zeros(n_cols, dtype=int)
+    hi_idx = np.zeros(n_cols, dtype=int)
+    R = np.zeros((k, n_cols))
+    took_low = np.zeros((k, n_cols), dtype=bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(k):
+            mean = s1 / cnt
+            std = np.sqrt(np.maximum((s2 - s1 * mean) / (cnt - 1), 0.0))
+
+            lo_val = low[lo_idx, cols] - shift
+            hi_val = high[hi_idx, cols] - shift
+            take_low = (mean - lo_val) > (hi_val - mean)
+            val = np.where(take_low, lo_val, hi_val)
+
+            active = (i < counts - 2) & (std > 0)
+            R[i] = np.where(active, np.abs(val - mean) / std, 0.0)
+            took_low[i] = take_low & active
+
+            s1 -= np.where(active, val, 0.0)
+            s2 -= np.where(active, val * val, 0.0)
+            cnt -= active
+            lo_idx += took_low[i]
+            hi_idx += active & ~take_low
+
+    lam = np.full((k, n_cols), np.inf)
+    for n in np.unique(counts[counts >= 3]):
+        lam[:, counts == n] = _esd_critical_values(int(n), k, alpha)[:, None]
+
+    # number of outliers = largest i with R_i > lambda_i
+    exceed = R > lam
+    n_out = np.where(exceed.any(axis=0), k - np.argmax(exceed[::-1], axis=0), 0)
+
+    low_cum = np.vstack([np.zeros((1, n_cols), dtype=int), np.cumsum(took_low, axis=0)])
+    low_used = low_cum[n_out, cols]
+    high_used = n_out - low_used
+
+    lo_thr = np.where(low_used > 0, low[np.maximum(low_used - 1, 0), cols], -np.inf)
+    hi_thr = np.where(high_used > 0, high[np.maximum(high_used - 1, 0), cols], np.inf)
+    hit = np.flatnonzero(n_out > 0)
+    if 2 * len(hit) > n_cols:
+        mask = (X <= lo_thr) | (X >= hi_thr)
+    elif len(hit):
+        sub = X[:, hit]
+        mask[:, hit] = (sub <= lo_thr[hit]) | (sub >= hi_thr[hit])
+
+    return mask[:, 0] if squeeze else mask
+
+
+#------------------------
+# Rolling median / MAD
+#------------------------
+# MAD of normal data times this constant estimates the standard deviation
+MAD_SCALE = 1.4826
+
+
+def _odd_window(window):
+    window = max(1, int(window))
+    return window if window % 2 else window + 1
+
+
+def _fill_gaps(T):
+    """
+    NaN/inf cells of per-mine rows replaced by the previous (else next) finite value.
+    Rows without any finite value become 0.
+    """
+    finite = np.isfinite(T)
+    if finite.all():
+        return T
+    idx = np.where(finite, np.arange(T.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    filled = np.take_along_axis(T, idx, axis=1)
+    # leading gaps: first finite value of the row
+    first = np.argmax(finite, axis=1)
+    lead = np.arange(T.shape[1]) < first[:, None]
+    filled = np.where(lead, np.take_along_axis(T, first[:, None], axis=1), filled)
+    filled[~finite.any(axis=1)] = 0
+    return filled
+
+
+def _median_rows(T, window, out=None):
+    """
+    Centered rolling median of every row of T (mines x days), edges reflected.
+    SciPy's 1D rank filter keeps the window in a sorted double heap, so each
+    step costs O(log w) instead of re-sorting w values.
+    """
+    out = np.empty_like(T) if out is None else out
+    for i in range(T.shape[0]):
+        ndimage.median_filter(T[i], size=window, mode="reflect", output=out[i])
+    return out
+
+
+def rolling_median(values, window):
+    """
+    Centered rolling median of each column of a 2D (days, mines) array.
+    Window is made odd; gaps are filled from neighbouring days.
+    """
+    X = np.asarray(values)
+    X = X if X.dtype in (np.float32, np.float64) else X.astype(float)
+    squeeze = X.ndim == 1
+    T = _fill_gaps(np.ascontiguousarray((X[:, None] if squeeze else X).T))
+    med = _median_rows(T, _odd_window(window)).T
+    return med[:, 0] if squeeze else med
+
+
+def weekday_factors(T, weekday, window):
+    """
+    Multiplicative day-of-week profile per mine (rows of T), mean 1 over the week:
+    median ratio of a weekday's values to the rolling median, with a window spanning
+    whole weeks so the rolling median itself carries no weekly pattern.
+    """
+    weeks = max(1, -(-int(window) // 7))
+    baseline = _median_rows(T, 7 * (weeks if weeks % 2 else weeks + 1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(baseline > 0, T / baseline, np.nan)
+    factors = np.ones((T.shape[0], 7))
+    for day in range(7):
+        cols = weekday == day
+        if cols.any() and np.isfinite(ratio[:, cols]).any():
+            with warnings.catch_warnings():
+                # mines with no positive baseline on that weekday keep factor 1
+                warnings.simplefilter("ignore", RuntimeWarning)
+                factors[:, day] = np.nanmedian(ratio[:, cols], axis=1)
+    factors[~np.isfinite(factors) | (factors <= 0)] = 1.0
+    return factors / factors.mean(axis=1, keepdims=True)
+
+
+def rolling_mad_anomalies(values, window=31, thresh=3.5, dates=None, seasonal=False):
+    """
+    Hampel filter on all columns of a 2D (days, mines) array: a value is anomalous when
+    it is more than thresh robust standard deviations (MAD_SCALE * rolling MAD) from
+    the centered rolling median. A spike moves neither the median nor the MAD, unlike
+    a moving mean. NaN cells are never flagged.
+    - window: days in the rolling window (made odd)
+    - thresh: threshold in robust standard deviations
+    - dates: row dates, needed for seasonal adjustment
+    - seasonal: divide values by each mine's day-of-week profile first
+    Returns boolean mask with the same shape as values.
+    """
+    X = np.asarray(values)
+    X = X if X.dtype in (np.float32, np.float64) else X.astype(float)
+    squeeze = X.ndim == 1
+    X = X[:, None] if squeeze else X
+    if X.size == 0:
+        mask = np.zeros(X.shape, dtype=bool)
+        return mask[:, 0] if squeeze else mask
+
+    window = _odd_window(window)
+    weekday = None
+    if seasonal and dates is not None:
+        weekday = (np.asarray(dates, dtype="datetime64[D]").astype("int64") + 3) % 7
+
+    mask = np.zeros(X.shape, dtype=bool)
+    # blocks of mines bound the temporaries; within a block every mine is one
+    # contiguous row, so each filter pass reads memory sequentially
+    step = max(1, (1 << 20) // len(X))
+    for lo in range(0, X.shape[1], step):
+        T = np.array(X[:, lo:lo + step].T, order="C")
+        missing = ~np.isfinite(T)
+        T = _fill_gaps(T)
+        if weekday is not None:
+            T /= weekday_factors(T, weekday, window)[:, weekday].astype(T.dtype)
+
+        resid = _median_rows(T, window)
+        np.subtract(T, resid, out=resid)
+        np.abs(resid, out=resid)
+        scale = _median_rows(resid, window)
+        scale *= MAD_SCALE * thresh
+        # flat windows have MAD 0: any change there is an outlier, but not rounding noise
+        floor = np.maximum(np.abs(T, out=T), 1.0, out=T)
+        floor *= 1e-9
+        np.maximum(scale, floor, out=scale)
+        block = resid > scale
+        block &= ~missing
+        mask[:, lo:lo + step] = block.T
+    return mask[:, 0] if squeeze else mask
+
+
 #-----------------
 # Detect Anomalies
 #-----------------
+@profiled("detect_anomalies")
 def detect_anomalies(df,
                      methods=["IQR", "z-score", "moving_avg", "grubbs"],
                      z_thresh=2.0,
                      ma_window=7,
                      iqr_factor=1.5,
-                     ma_pct=0.2
+                     ma_pct=0.2,
+                     esd_max_outliers=10,
+                     esd_alpha=0.05,
+                     mad_window=31,
+                     mad_thresh=3.5,
+                     mad_seasonal=False,
+                     col_stats=None
                      ):
     """
     Function for detecting anomalies in dataframe.
@@ -48,59 +500,62 @@ def detect_anomalies(df,
     - z_thresh: threshold for z-score
     - ma_window: window size for moving average
     - iqr_factor: factor for iqr
+    - esd_max_outliers: upper bound of outliers per mine for generalized ESD ("grubbs")
+    - esd_alpha: significance level for generalized ESD
+    - mad_window: window size for rolling median / MAD ("rolling_mad")
+    - mad_thresh: threshold in robust standard deviations for "rolling_mad"
+    - mad_seasonal: remove day-of-week profile before "rolling_mad"
+    - col_stats: precomputed ColumnStats for df, shared with calculate_stats
     """
-    mine_cols = [
-        col for col in df.columns
-        if col not in ["Date"] and "Randomizer" not in col and pd.api.types.is_numeric_dtype(df[col])
-    ]
+    mine_cols = _numeric_cols(df)
 
-    anomalies = pd.DataFrame(False, index=df.index, columns=mine_cols)
+    # one boolean array for all methods, wrapped in a DataFrame once at the end
+    anomalies = np.zeros((len(df), len(mine_cols)), dtype=bool)
+
+    if {"IQR", "z-score"} & set(methods):
+        if col_stats is None or col_stats.columns != mine_cols:
+            col_stats = ColumnStats.from_frame(df, mine_cols)
+        values = _float_values(df, mine_cols)
+
+    shape = {"rows": len(df), "cols": len(mine_cols)}
 
     # --- IQR ---
     if "IQR" in methods:
-        Q1 = df[mine_cols].quantile(0.25)
-        Q3 = df[mine_cols].quantile(0.75)
-        IQR = Q3 - Q1
-        anomalies |= (df[mine_cols] < (Q1 - iqr_factor * IQR)) | (df[mine_cols] > (Q3 + iqr_factor * IQR))
+        with span("detect_anomalies[IQR]", **shape):
+            Q1 = col_stats.quantile(0.25)
+            Q3 = col_stats.quantile(0.75)
+            IQR = Q3 - Q1
+            anomalies |= (values < (Q1 - iqr_factor * IQR)) | (values > (Q3 + iqr_factor * IQR))
 
     # --- Z-score ---
     if "z-score" in methods:
-        zscores = (df[mine_cols] - df[mine_cols].mean()) / df[mine_cols].std(ddof=0)
-        anomalies |= zscores.abs() > z_thresh
+        with span("detect_anomalies[z-score]", **shape), np.errstate(invalid="ignore", divide="ignore"):
+            zscores = (values - col_stats.mean) / col_stats.std(ddof=0)
+            anomalies |= np.abs(zscores) > z_thresh
 
     # --- Moving average ---
     if "moving_avg" in methods:
-        for col in mine_cols:
-            ma = df[col].rolling(window=ma_window, center=True).mean()
-            diff = (df[col] - ma).abs()
-
-            distance = pd.Series(0.0, index=df.index)
-            nonzero = ma.abs() > 1e-12
-            distance[nonzero] = diff[nonzero] / ma[nonzero]
-            anomalies[col] |= distance > ma_pct
-
-    # --- Grubbs ---
-    if "grubbs" in methods:
-        for col in mine_cols:
-            series = df[col].dropna().values
-            N = len(series)
-            if N < 3:
-                continue
-
-            mean_val = np.mean(series)
-            std_val = np.std(series, ddof=1)
-            if std_val == 0:
-                continue
-
-            t = sp_stats.t.ppf(1 - 0.05 / (2 * N), N - 2)
-            Gcrit = ((N - 1) / np.sqrt(N)) * np.sqrt(t ** 2 / (N - 2 + t ** 2))
-
-            for i in range(len(df)):
-                val = df.at[i, col]
-                if pd.isna(val):
-                    continue
-                G = abs(val - mean_val) / std_val
-                if G > Gcrit:
-                    anomalies.at[i, col] = True
-
-    return anomalies
\ No newline at end of file
+        with span("detect_anomalies[moving_avg]", **shape):
+            for j, col in enumerate(mine_cols):
+                ma = df[col].rolling(window=ma_window, center=True).mean()
+                diff = (df[col] - ma).abs()
+
+                distance = pd.Series(0.0, index=df.index)
+                nonzero = ma.abs() > 1e-12
+                distance[nonzero] = diff[nonzero] / ma[nonzero]
+                anomalies[:, j] |= (distance > ma_pct).to_numpy()
+
+    # --- Rolling median / MAD ---
+    if "rolling_mad" in methods and mine_cols:
+        with span("detect_anomalies[rolling_mad]", **shape):
+            anomalies |= rolling_mad_anomalies(_float_values(df, mine_cols), mad_window, mad_thresh,
+                                               dates=df["Date"] if "Date" in df.columns else None,
+                                               seasonal=mad_seasonal)
+
+    # --- Grubbs (generalized ESD) ---
+    if "grubbs" in methods and mine_cols:
+        with span("detect_anomalies[grubbs]", **shape):
+            anomalies |= generalized_esd(df[mine_cols].to_numpy(dtype=float),
+                                         max_outliers=esd_max_outliers, alpha=esd_alpha)
+
+    return pd.DataFrame(anomalies, index=df.index, columns=mine_cols)
\ No newline at end of file
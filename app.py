@@ -2,14 +2,25 @@
 Main script for running the app.
 """
 
+import time
+import uuid
+
 import streamlit as st
 import pandas as pd
 
 
-from data.loader import load_data, load_events
-from analysis.stats import calculate_stats, detect_anomalies
-from charts.plotting import create_figure
-from pdf.report import generate_full_pdf
+from data.loader import configured_sources, load_data_and_events, load_sites
+from data.store import compact_frame, date_bounds
+from analysis.dag import StageGraph
+from analysis.profiling import Profiler, activate, deactivate
+from analysis.shared import SharedStore, session_view, value_nbytes
+from analysis.cache import AnalysisCache, cached_episodes, cached_stats, dataset_version
+from analysis.fleet import fleet_event_days, fleet_scores
+from analysis.forecast import update_forecaster
+from analysis.rollup import AGGREGATES, RESOLUTIONS, choose_resolution, update_rollup
+from charts.plotting import DEFAULT_MAX_POINTS, create_figure
+from charts.trend import trend_lines
+from pdf.jobs import ReportJobQueue, report_key
 
 #----------------------------
 # Streamlit page configurator
@@ -17,124 +28,434 @@ from pdf.report import generate_full_pdf
 st.set_page_config(page_title="Weyland-Yutani Mines Dashboard", layout="wide")
 st.title("Weyland-Yutani Mines Dashboard")
 
+# ------------------------------------------------------------------
+# Pipeline stages (load -> clean -> stats / masks -> slice -> figure)
+# ------------------------------------------------------------------
+# data is re-checked for new rows at most once per DATA_TTL_SECONDS (or on reload)
+DATA_TTL_SECONDS = 60
+
+
+
+@st.cache_resource(show_spinner=False)
+def get_shared_store():
+    # one copy of each data version and its stats/masks per process, shared by all sessions
+    return SharedStore()
+
+
+shared_store = get_shared_store()
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+# stage functions are redefined on every rerun, their results live in session_state
+graph = StageGraph(memo=st.session_state.setdefault("stage_memo", {}))
+
+
+def _load_shared(full_refresh):
+    sources = configured_sources()
+    if sources:
+        # several sites (spreadsheets) read concurrently, one column per site and mine
+        df, events, errors = load_sites(sources, full_refresh=full_refresh)
+        if len(df) == 0:
+            st.error("No site could be loaded: " + "; ".join(f"{k}: {v}" for k, v in errors.items()))
+            st.stop()
+    else:
+        df, events = load_data_and_events(full_refresh=full_refresh)
+        errors = {}
+    df = compact_frame(df)
+    df.attrs["site_errors"] = errors
+    df.attrs["dataset_version"] = dataset_version(df)
+    return df, events
+
+
+def _clean_version(df):
+    return df.attrs.get("dataset_version") or dataset_version(df)
+
+
+@graph.stage("load", params=("refresh_token",))
+def load_stage(refresh_token):
+    # the sheet is read once per TTL window for all sessions; a full reload is this session's own read
+    full_refresh = st.session_state.pop("full_reload", False)
+    key = ("load", session_id, refresh_token) if full_refresh else ("load", refresh_token[1])
+    return session_view(shared_store.acquire(session_id, "load", key, lambda: _load_shared(full_refresh)))
+
+
+@graph.stage("clean", inputs=("load",), fingerprint=_clean_version)
+def clean_stage(load):
+    # kept per data version, so sessions on different TTL windows still share one frame
+    df = load[0]
+    return session_view(shared_store.acquire(session_id, "dataset", ("dataset", _clean_version(df)), lambda: df))
+
 
-# ----------------------------------
-# Load data, events, calculate stats
-# ----------------------------------
-data = load_data()
-st.subheader("Preview of Generated Data")
-st.dataframe(data.head())
+@graph.stage("events", inputs=("load",), fingerprint=repr)
+def events_stage(load):
+    return load[1]
 
-events = load_events()
 
-stats = calculate_stats(data)
+@graph.stage("analysis_cache", inputs=("clean",))
+def analysis_cache_stage(clean):
+    # stats, masks and trend fits of a data version, shared by every session showing it
+    version = graph.version("clean")
+    return shared_store.acquire(session_id, "analysis", ("analysis", version), AnalysisCache)
 
 
-#-----------------
-# Sidebar controls
-#-----------------
-# date range filter
-min_date = data['Date'].min()
-max_date = data['Date'].max()
-date_range = st.sidebar.date_input("Date range", [min_date, max_date], min_value=min_date, max_value=max_date)
+@graph.stage("stats", inputs=("clean", "analysis_cache"))
+def stats_stage(clean, analysis_cache):
+    return session_view(cached_stats(clean, analysis_cache, version=graph.version("clean")))
 
-# Sidebar controls
-st.sidebar.header("Controls")
-methods_selected = st.sidebar.multiselect("Anomaly methods", ["IQR", "z-score", "moving_avg", "grubbs"], default=["IQR", "z-score"])
-z_thresh = st.sidebar.slider("z-score threshold", 2.0, 5.0, 3.0, step=0.5)
-ma_window = st.sidebar.slider("MA window (days)", 3, 30, 7)
-ma_pct = st.sidebar.slider("MA percent threshold", 0.05, 0.5, 0.2, step=0.01)
-iqr_factor = st.sidebar.slider("IQR factor", 1.0, 3.0, 1.5, step=0.1)
 
-all_mines = [
-    col for col in data.columns
-    if col not in ["Date"] and "Randomizer" not in col and pd.api.types.is_numeric_dtype(data[col])
-]
+@graph.stage("rollup", inputs=("clean",), incremental=True)
+def rollup_stage(clean, previous):
+    # weekly/monthly/quarterly rollups, extended in place when only new days arrived
+    return update_rollup(previous, clean)
 
-selected_mines = st.sidebar.multiselect("Select mines", all_mines, default=[all_mines[0]])
-if not selected_mines:
-    st.warning("Select at least one mine to proceed.")
-    st.stop()
 
-chart_type = st.sidebar.selectbox("Chart type", ["line", "bar", "stacked"])
-show_trend = st.sidebar.checkbox("Show polynomial trendline (single mine only)", value=True)
-trend_degree = st.sidebar.selectbox("Trendline degree (1-4)", [1,2,3,4], index=0)
+@graph.stage("forecaster", inputs=("clean",), incremental=True)
+def forecaster_stage(clean, previous):
+    # Holt-Winters state of all mines, advanced over new days instead of refitted
+    return update_forecaster(previous, clean)
 
-# compute anomalies with chosen params
-anomalies = detect_anomalies(data, methods=methods_selected, z_thresh=z_thresh,
-                             ma_window=ma_window, iqr_factor=iqr_factor, ma_pct=ma_pct)
-# date filtering
-start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-mask = (data['Date'] >= start_date) & (data['Date'] <= end_date)
-df_view = data.loc[mask].reset_index(drop=True)
-anomalies_view = anomalies.loc[mask].reset_index(drop=True)
 
+@graph.stage("forecast", inputs=("forecaster",), params=("forecast_days",))
+def forecast_stage(forecaster, forecast_days):
+    return forecaster.forecast(forecast_days) if forecast_days else None
 
-# ----------
-# Plot chart
-# ----------
-fig = create_figure(
-    df_view=df_view,
-    anomalies_view=anomalies_view,
-    selected_mines=selected_mines,
-    chart_type=chart_type,
-    show_trend=show_trend,
-    trend_degree=trend_degree
-)
 
-st.plotly_chart(fig, width="stretch")
+@graph.stage("episodes", inputs=("clean", "analysis_cache"),
+             params=("methods", "z_thresh", "ma_window", "ma_pct", "iqr_factor", "esd_max_outliers",
+                     "mad_window", "mad_thresh", "mad_seasonal"))
+def episodes_stage(clean, analysis_cache, methods, **params):
+    # runs of anomalous days per mine; summary, chart markers and PDF all query this index
+    # (one cached mask per method, so a parameter change recomputes only its method)
+    return cached_episodes(clean, analysis_cache, methods, version=graph.version("clean"), **params)
 
 
-#-------------------------------------
-#Show statistics and anomalies summary
-#-------------------------------------
-st.subheader("Statistics (per mine)")
-display_list = selected_mines.copy()
-if "Total" in stats.index and "Total" not in display_list:
-    display_list = display_list + ["Total"]
-st.dataframe(stats.loc[display_list])
+@graph.stage("fleet", inputs=("clean",))
+def fleet_stage(clean):
+    # all mines scored jointly per day (Mahalanobis distance of robust z-scores)
+    key = ("fleet", graph.version("clean"))
+    return session_view(shared_store.acquire(session_id, "fleet", key, lambda: fleet_scores(clean)))
 
-st.subheader("Anomalies summary (count per mine in selected date range)")
 
-anomalies_view_bool = anomalies_view.copy().astype(bool)
-mine_cols_for_counts = [m for m in selected_mines if m in anomalies_view_bool.columns]
+@graph.stage("view", inputs=("clean",), params=("date_range",))
+def view_stage(clean, date_range):
+    # date filtering (binary search on the sorted Date column)
+    lo, hi = date_bounds(clean["Date"], date_range[0], date_range[1])
+    return clean.iloc[lo:hi].reset_index(drop=True)
 
-if not mine_cols_for_counts:
-    st.info("No valid mine selected for anomaly summary.")
-else:
-    per_mine_counts = anomalies_view_bool[mine_cols_for_counts].sum().astype(int)
 
-    sum_of_anomalies = int(per_mine_counts.sum())
+@graph.stage("summary", inputs=("episodes",), params=("selected_mines", "date_range"))
+def summary_stage(episodes, selected_mines, date_range):
+    # counts come from episode boundaries, not from scanning the days of the range
+    mine_cols = [m for m in selected_mines if m in episodes.columns]
+    if not mine_cols:
+        return None
+    start, end = date_range
+    per_mine_counts = episodes.day_counts(start, end, mine_cols)
+    return {
+        "per_mine_counts": per_mine_counts,
+        "episode_counts": episodes.episode_counts(start, end, mine_cols),
+        "sum_of_anomalies": int(per_mine_counts.sum()),
+        "unique_anomaly_days": episodes.unique_days(start, end, mine_cols),
+    }
 
-    unique_anomaly_days = int(anomalies_view_bool[mine_cols_for_counts].any(axis=1).sum())
 
-    st.table(per_mine_counts.to_frame(name='Anomaly count'))
+@graph.stage("chart_data", inputs=("view", "rollup", "episodes"),
+             params=("date_range", "resolution_choice", "rollup_agg"))
+def chart_data_stage(view, rollup, episodes, date_range, resolution_choice, rollup_agg):
+    # long ranges are charted from rollups (anomaly marker = period with anomalous days)
+    start, end = date_range
+    resolution = choose_resolution(start, end) if resolution_choice == "auto" else resolution_choice
+    if resolution == "daily":
+        return {"resolution": resolution, "df": view, "anomalies": episodes.mask(start, end)}
+    return {
+        "resolution": resolution,
+        "df": rollup.frame(resolution, rollup_agg, start, end),
+        "anomalies": rollup.anomaly_counts(episodes, resolution, start, end).drop(columns="Date") > 0,
+    }
 
-    st.markdown(f"**Sum of anomalies (sum of per-mine counts):** {sum_of_anomalies}")
-    st.markdown(f"**Unique anomaly days (at least one mine):** {unique_anomaly_days}")
 
+@graph.stage("trends", inputs=("chart_data",),
+             params=("selected_mines", "trend_degree", "show_trend", "rollup_agg"))
+def trends_stage(chart_data, selected_mines, trend_degree, show_trend, rollup_agg):
+    if not show_trend:
+        return None
+    # trend fits cached per (data version, mine, degree, date window)
+    version = graph.version("clean")
+    if chart_data["resolution"] != "daily":
+        version = f"{version}:{chart_data['resolution']}:{rollup_agg}"
+    return trend_lines(chart_data["df"], selected_mines, trend_degree, cache=analysis_cache, version=version)
 
-# -------------
-# PDF Generator
-# -------------
-if st.button("Generate PDF Report"):
-
-    events_from_sheet = load_events()
-
-    file_path = generate_full_pdf(
-        df=data,
-        stats_df=stats,
-        anomalies=anomalies,
-        events=events_from_sheet,
+
+@graph.stage("figure", inputs=("chart_data", "trends", "forecast"),
+             params=("selected_mines", "chart_type", "show_trend", "trend_degree", "max_points",
+                     "date_range", "rollup_agg"))
+def figure_stage(chart_data, trends, forecast, selected_mines, chart_type, show_trend, trend_degree,
+                 max_points, date_range, rollup_agg):
+    # the forecast continues the chart only when it reaches the last day, and is
+    # not comparable with period sums
+    if forecast is not None and (date_range[1] < forecast["Date"].iloc[0] - pd.Timedelta(days=1)
+                                 or (chart_data["resolution"] != "daily" and rollup_agg == "sum")):
+        forecast = None
+    return create_figure(
+        df_view=chart_data["df"],
+        anomalies_view=chart_data["anomalies"],
         selected_mines=selected_mines,
         chart_type=chart_type,
-        trend_degree=trend_degree
+        show_trend=show_trend,
+        trend_degree=trend_degree,
+        max_points=max_points,
+        trends=trends,
+        forecasts=forecast,
+    )
+
+
+# stage timings of this rerun, shown in the profiling panel at the bottom of the sidebar
+profiler = Profiler()
+profiler_token = activate(profiler)
+try:
+    # ---------------------
+    # Load data and events
+    # ---------------------
+    if st.sidebar.button("Reload full sheet (ignore local snapshot)"):
+        st.session_state["full_reload"] = True
+        st.session_state["reload_count"] = st.session_state.get("reload_count", 0) + 1
+
+    graph.set_params(refresh_token=(st.session_state.get("reload_count", 0), int(time.time() // DATA_TTL_SECONDS)))
+    data = graph.get("clean")
+    events = graph.get("events")
+    data_version = graph.version("clean")
+    analysis_cache = graph.get("analysis_cache")
+    stats = graph.get("stats")
+
+    for site, error in data.attrs.get("site_errors", {}).items():
+        st.warning(f"Site '{site}' could not be loaded: {error}")
+
+    st.subheader("Preview of Generated Data")
+    st.dataframe(data.head())
+
+
+    #-----------------
+    # Sidebar controls
+    #-----------------
+    # date range filter
+    min_date = data['Date'].min()
+    max_date = data['Date'].max()
+    date_range = st.sidebar.date_input("Date range", [min_date, max_date], min_value=min_date, max_value=max_date)
+
+    # Sidebar controls
+    st.sidebar.header("Controls")
+    methods_selected = st.sidebar.multiselect("Anomaly methods", ["IQR", "z-score", "moving_avg", "rolling_mad", "grubbs"], default=["IQR", "z-score"])
+    z_thresh = st.sidebar.slider("z-score threshold", 2.0, 5.0, 3.0, step=0.5)
+    ma_window = st.sidebar.slider("MA window (days)", 3, 30, 7)
+    ma_pct = st.sidebar.slider("MA percent threshold", 0.05, 0.5, 0.2, step=0.01)
+    iqr_factor = st.sidebar.slider("IQR factor", 1.0, 3.0, 1.5, step=0.1)
+    esd_max_outliers = st.sidebar.slider("Grubbs (generalized ESD) max outliers per mine", 1, 50, 10)
+    mad_window = st.sidebar.slider("Rolling MAD window (days)", 7, 365, 31)
+    mad_thresh = st.sidebar.slider("Rolling MAD threshold (robust sd)", 2.0, 8.0, 3.5, step=0.5)
+    mad_seasonal = st.sidebar.checkbox("Rolling MAD: remove day-of-week pattern", value=False)
+    forecast_days = st.sidebar.slider("Forecast horizon (days, 0 = off)", 0, 365, 0)
+
+    all_mines = [
+        col for col in data.columns
+        if col not in ["Date"] and "Randomizer" not in col and pd.api.types.is_numeric_dtype(data[col])
+    ]
+
+    selected_mines = st.sidebar.multiselect("Select mines", all_mines, default=[all_mines[0]])
+    if not selected_mines:
+        st.warning("Select at least one mine to proceed.")
+        st.stop()
+
+    graph.set_params(
+        methods=methods_selected, z_thresh=z_thresh, ma_window=ma_window, ma_pct=ma_pct,
+        iqr_factor=iqr_factor, esd_max_outliers=esd_max_outliers, mad_window=mad_window,
+        mad_thresh=mad_thresh, mad_seasonal=mad_seasonal, forecast_days=forecast_days,
+        selected_mines=selected_mines, date_range=(pd.to_datetime(date_range[0]), pd.to_datetime(date_range[-1])),
     )
-    with open(file_path, "rb") as f:
-        st.download_button(
-            label="Download PDF",
-            data=f,
-            file_name="report.pdf",
-            mime="application/pdf"
+    episodes = graph.get("episodes")
+
+    cache_info = analysis_cache.info()
+    with st.sidebar.expander("Analysis cache (shared by sessions on this data version)"):
+        st.caption(
+            f"Hits: {cache_info['hits']} | Misses: {cache_info['misses']} | "
+            f"Hit rate: {cache_info['hit_rate']:.0%}"
+        )
+        st.caption(f"Entries: {cache_info['entries']} | Size: {cache_info['bytes'] / 1024 ** 2:.1f} MB")
+
+
+    # ----------
+    # Plot chart
+    # ----------
+    @st.fragment
+    def chart_section():
+        # chart options live in a fragment: changing them reruns only this block
+        col1, col2, col3, col4 = st.columns(4)
+        chart_type = col1.selectbox("Chart type", ["line", "bar", "stacked"], key="chart_type")
+        resolution_choice = col2.selectbox("Chart resolution", ["auto"] + list(RESOLUTIONS), key="resolution_choice")
+        rollup_agg = col3.selectbox("Rollup aggregate (weekly and coarser)", AGGREGATES, key="rollup_agg")
+        trend_degree = col4.selectbox("Trendline degree (1-4)", [1, 2, 3, 4], key="trend_degree")
+        col1, col2, col3 = st.columns(3)
+        show_trend = col1.checkbox("Show polynomial trendlines", value=True, key="show_trend")
+        fast_render = col2.checkbox("Fast render (LTTB downsampling)", value=True, key="fast_render")
+        max_points = col3.number_input("Points per series", 200, 20000, DEFAULT_MAX_POINTS, step=200,
+                                       disabled=not fast_render, key="max_points")
+
+        graph.set_params(
+            chart_type=chart_type, resolution_choice=resolution_choice, rollup_agg=rollup_agg,
+            trend_degree=trend_degree, show_trend=show_trend,
+            max_points=int(max_points) if fast_render else None,
+        )
+        chart_data = graph.get("chart_data")
+        fig = graph.get("figure")
+
+        st.plotly_chart(fig, width="stretch")
+        if chart_data["resolution"] != "daily":
+            st.caption(f"{chart_data['resolution'].capitalize()} {rollup_agg} per mine ({len(chart_data['df'])} periods)")
+        point_counts = fig.layout.meta or {}
+        if point_counts.get("points_original"):
+            st.caption(f"Rendered {point_counts['points_rendered']:,} of {point_counts['points_original']:,} points")
+
+
+    chart_section()
+
+
+    #-------------------------------------
+    #Show statistics and anomalies summary
+    #-------------------------------------
+    st.subheader("Statistics (per mine)")
+    display_list = selected_mines.copy()
+    if "Total" in stats.index and "Total" not in display_list:
+        display_list = display_list + ["Total"]
+    st.dataframe(stats.loc[display_list])
+
+    st.subheader("Anomalies summary (count per mine in selected date range)")
+
+    summary = graph.get("summary")
+    if summary is None:
+        st.info("No valid mine selected for anomaly summary.")
+    else:
+        st.table(pd.DataFrame({"Anomaly count": summary["per_mine_counts"],
+                               "Episodes": summary["episode_counts"]}))
+
+        st.markdown(f"**Sum of anomalies (sum of per-mine counts):** {summary['sum_of_anomalies']}")
+        st.markdown(f"**Unique anomaly days (at least one mine):** {summary['unique_anomaly_days']}")
+
+    if st.checkbox("Fleet-wide event days (all mines scored jointly)"):
+        fleet = graph.get("fleet")
+        lo, hi = date_bounds(fleet["Date"], date_range[0], date_range[-1])
+        fleet_days = fleet_event_days(fleet.iloc[lo:hi])
+        st.markdown(f"**Fleet-wide event days in selected range:** {len(fleet_days)}")
+        if len(fleet_days):
+            st.dataframe(fleet_days.assign(top_mines=fleet_days["top_mines"].str.join(", "))
+                         [["Date", "score", "p_value", "top_mines", "top_share"]], hide_index=True)
+
+
+    # -------------
+    # PDF Generator
+    # -------------
+    @st.cache_resource(show_spinner=False)
+    def get_report_queue():
+        # one worker pool per process, shared by all sessions
+        return ReportJobQueue(max_workers=2)
+
+
+    report_queue = get_report_queue()
+
+    # chart options come from the chart fragment's widgets
+    chart_type = st.session_state.get("chart_type", "line")
+    trend_degree = st.session_state.get("trend_degree", 1)
+    show_trend = st.session_state.get("show_trend", True)
+
+    if st.button("Generate PDF Report"):
+        key = report_key(
+            data_version,
+            mines=selected_mines, chart_type=chart_type, trend_degree=trend_degree, show_trend=show_trend,
+            methods=sorted(methods_selected), z_thresh=z_thresh, ma_window=ma_window, ma_pct=ma_pct,
+            iqr_factor=iqr_factor, esd_max_outliers=esd_max_outliers, mad_window=mad_window,
+            mad_thresh=mad_thresh, mad_seasonal=mad_seasonal, forecast_days=forecast_days,
+        )
+        job = report_queue.submit(
+            key,
+            df=data,
+            stats_df=stats,
+            anomalies=episodes,
+            events=events,
+            selected_mines=selected_mines,
+            chart_type=chart_type,
+            trend_degree=trend_degree,
+            show_trend=show_trend,
+            trends=trend_lines(data, selected_mines, trend_degree,
+                               cache=analysis_cache, version=data_version) if show_trend else None,
+            version=data_version,
+            forecasts=graph.get("forecast"),
+        )
+        st.session_state["report_job_id"] = job.id
+
+    report_job = report_queue.get(st.session_state.get("report_job_id"))
+    # decided once per full run; the fragment reruns the app when the job finishes
+    report_polling = report_job is not None and not report_job.done
+
+
+    @st.fragment(run_every=1.0 if report_polling else None)
+    def report_status():
+        # polls the background job without rerunning the whole dashboard
+        job = report_queue.get(st.session_state.get("report_job_id"))
+        if job is None:
+            return
+        if report_polling and job.done:
+            # run_every is only decided on a full run: rerun the app once to stop polling
+            st.rerun(scope="app")
+
+        if job.status == "failed":
+            st.error(f"PDF generation failed: {job.error}")
+        elif job.status == "done":
+            st.download_button(
+                label="Download PDF",
+                data=job.result,
+                file_name="report.pdf",
+                mime="application/pdf"
+            )
+            st.success(f"PDF successfully generated in {job.seconds:.1f}s. Click the button above to download.")
+        else:
+            st.progress(job.progress, text=f"Generating PDF: {job.message}")
+
+
+    report_status()
+
+
+    #----------------
+    # Profiling panel
+    #----------------
+    if st.sidebar.checkbox("Show profiling panel", value=False):
+        with st.sidebar.expander("Pipeline profile", expanded=True):
+            st.caption(f"Rerun total: {profiler.total_seconds * 1000:.0f} ms")
+            st.caption(f"Recomputed stages: {', '.join(graph.recomputed) or 'none'}")
+            st.dataframe(profiler.frame(), hide_index=True)
+            st.download_button("Export JSON", profiler.to_json(), file_name="profile.json",
+                               mime="application/json")
+            st.download_button("Export Prometheus", profiler.to_prometheus(), file_name="profile.prom",
+                               mime="text/plain")
+            if report_job is not None and report_job.done:
+                st.caption(f"Last PDF report ({report_job.profile.total_seconds * 1000:.0f} ms)")
+                st.dataframe(report_job.profile.frame(), hide_index=True)
+
+
+    #--------------------
+    # Shared memory panel
+    #--------------------
+    # memory this session holds outside the shared store (its rollups; episode indexes live in the analysis cache)
+    PRIVATE_STAGES = ("rollup", "forecaster")
+    shared_store.touch(session_id, private_bytes=sum(
+        value_nbytes(graph.memo[name].value) for name in PRIVATE_STAGES if name in graph.memo
+    ))
+
+    with st.sidebar.expander("Shared memory (all sessions)"):
+        store_info = shared_store.info()
+        st.caption(
+            f"Sessions: {store_info['sessions']} | Entries: {store_info['entries']} | "
+            f"Size: {store_info['bytes'] / 1024 ** 2:.1f} MB | Builds: {store_info['builds']} | "
+            f"Reused: {store_info['hits']}"
         )
-    st.success("PDF successfully generated. Click the button above to download.")
+        st.caption(f"This session: {session_id[:8]}")
+        st.dataframe(shared_store.session_report().round(2), hide_index=True)
+finally:
+    # st.stop()/st.rerun() raise, so the profiler is reset here rather than at the end
+    deactivate(profiler_token)
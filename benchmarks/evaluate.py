@@ -0,0 +1,253 @@
+"""
+Script used for measuring detector quality and cost on synthetic data with known events.
+
+The same seeded dataset is generated twice, with and without injected spike/drop
+events (event draws use their own random stream, so values do not shift). Cells
+the events moved by more than min_effect are the ground truth. Every method and
+parameter combination of detect_anomalies is scored against it in a process pool:
+cell precision/recall/F1, share of (event, mine) windows detected, and rows/sec.
+
+Examples:
+    python -m benchmarks.evaluate --days 3650 --mines 50 --events 40 --workers 4
+    python -m benchmarks.evaluate --min-f1 0.6 --output eval.json
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analysis.stats import detect_anomalies
+from data.generator import generate_data
+from data.store import compact_frame, date_bounds
+
+# parameter values tried per method (all combinations)
+DEFAULT_GRID = {
+    "IQR": {"iqr_factor": [1.5, 2.0, 3.0]},
+    "z-score": {"z_thresh": [2.0, 3.0, 4.0]},
+    "moving_avg": {"ma_window": [7, 31], "ma_pct": [0.2, 0.3]},
+    "rolling_mad": {"mad_window": [15, 31, 91], "mad_thresh": [3.0, 3.5, 5.0], "mad_seasonal": [False, True]},
+    "grubbs": {"esd_max_outliers": [10, 50]},
+}
+DOW_MULTIPLIERS = [1, 1, 1, 1, 1, 0.8, 0.6]
+
+# worker process state, filled by _init_worker
+_shared = {}
+
+
+#------------------------
+# Data with ground truth
+#------------------------
+def random_events(start_date, days, n_events, seed=None):
+    """
+    Spike and drop events in load_events() format, placed at random days.
+    """
+    rng = np.random.default_rng(seed)
+    starts = pd.Timestamp(start_date) + pd.to_timedelta(rng.integers(0, max(days - 10, 1), n_events), unit="D")
+    spikes = rng.random(n_events) < 0.5
+    return [{
+        "date": day.strftime("%Y-%m-%d"),
+        "duration": int(rng.integers(1, 11)),
+        "factor": float(rng.uniform(1.5, 3.0) if spike else rng.uniform(0.2, 0.6)),
+        "prob": float(rng.uniform(0.3, 1.0)),
+    } for day, spike in zip(starts, spikes)]
+
+
+def make_dataset(days, mines, events, start_date="2015-01-01", seed=0, min_effect=0.3,
+                 p1=100, p2=10, correlation=0.3, dow_multipliers=DOW_MULTIPLIERS):
+    """
+    (df, truth): compact mine data with events applied, and boolean frame of cells
+    the events changed by more than min_effect (fraction of the value). Default noise
+    (p1=100, p2=10: 10% sd) makes min_effect=0.3 a 3 sigma change.
+    """
+    params = dict(p1=p1, p2=p2, correlation=correlation, dow_multipliers=dow_multipliers, seed=seed)
+    base = generate_data(start_date, days, mines, **params).drop(columns="Total")
+    df = generate_data(start_date, days, mines, events=events, **params).drop(columns="Total")
+
+    cols = [c for c in df.columns if c != "Date"]
+    before, after = base[cols].to_numpy(), df[cols].to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        effect = np.abs(after - before) / np.where(before > 0, before, np.nan)
+    truth = pd.DataFrame(np.nan_to_num(effect) > min_effect, columns=cols)
+    return compact_frame(df), truth
+
+
+def event_spans(dates, events):
+    """
+    Positional [lo, hi) rows of every event window.
+    """
+    spans = []
+    for ev in events:
+        start = pd.Timestamp(ev["date"])
+        lo, hi = date_bounds(dates, start, start + pd.Timedelta(days=int(ev["duration"])))
+        if hi > lo:
+            spans.append((lo, hi))
+    return spans
+
+
+#---------
+# Scoring
+#---------
+def score_mask(mask, truth, spans):
+    """
+    Cell precision/recall/F1 and event recall (share of (event, mine) windows with
+    at least one true cell that got at least one flag).
+    """
+    tp = int((mask & truth).sum())
+    fp = int((mask & ~truth).sum())
+    fn = int((~mask & truth).sum())
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    windows = detected = 0
+    for lo, hi in spans:
+        hit = truth[lo:hi].any(axis=0)
+        windows += int(hit.sum())
+        detected += int((mask[lo:hi] & truth[lo:hi]).any(axis=0).sum())
+
+    return {
+        "tp": tp, "fp": fp, "fn": fn,
+        "precision": precision, "recall": recall, "f1": f1,
+        "event_recall": detected / windows if windows else 0.0,
+    }
+
+
+def param_grid(grid=DEFAULT_GRID, methods=None):
+    """
+    (method, params) for every combination of the grid's parameter values.
+    """
+    configs = []
+    for method, params in grid.items():
+        if methods and method not in methods:
+            continue
+        names = list(params)
+        for values in itertools.product(*(params[n] for n in names)):
+            configs.append((method, dict(zip(names, values))))
+    return configs
+
+
+def _init_worker(df, truth, spans):
+    _shared["df"] = df
+    _shared["truth"] = truth.to_numpy(dtype=bool)
+    _shared["columns"] = list(truth.columns)
+    _shared["spans"] = spans
+
+
+def _evaluate(config, repeat=1):
+    """
+    Runs one (method, params) configuration. Runs in a worker process.
+    """
+    method, params = config
+    df = _shared["df"]
+    best = float("inf")
+    for _ in range(max(repeat, 1)):
+        t0 = time.perf_counter()
+        anomalies = detect_anomalies(df, methods=[method], **params)
+        best = min(best, time.perf_counter() - t0)
+
+    mask = anomalies[_shared["columns"]].to_numpy(dtype=bool)
+    return {
+        "method": method,
+        "params": params,
+        **score_mask(mask, _shared["truth"], _shared["spans"]),
+        "seconds": best,
+        "rows_per_sec": len(df) / best if best > 0 else float("inf"),
+    }
+
+
+#--------
+# Runner
+#--------
+def run_evaluation(days=3650, mines=20, n_events=30, seed=0, grid=DEFAULT_GRID, methods=None,
+                   workers=None, repeat=1, min_effect=0.3, log=print):
+    """
+    Scores every configuration of the grid. Returns list of result dicts, best F1 first.
+    Timings of parallel workers share the CPU; use workers=1 for clean throughput numbers.
+    """
+    events = random_events("2015-01-01", days, n_events, seed=seed)
+    df, truth = make_dataset(days, mines, events, seed=seed, min_effect=min_effect)
+    spans = event_spans(df["Date"], events)
+    configs = param_grid(grid, methods)
+    log(f"{days} days x {mines} mines, {len(events)} events ({int(truth.to_numpy().sum())} true cells), "
+        f"{len(configs)} configurations")
+
+    if workers == 1:
+        _init_worker(df, truth, spans)
+        results = [_evaluate(config, repeat) for config in configs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(df, truth, spans)) as pool:
+            results = list(pool.map(_evaluate, configs, [repeat] * len(configs)))
+
+    results.sort(key=lambda r: r["f1"], reverse=True)
+    return results
+
+
+def cheapest(results, min_f1=0.0, min_precision=0.0, min_recall=0.0):
+    """
+    Fastest configuration meeting the accuracy bar, None if none does.
+    """
+    passing = [r for r in results
+               if r["f1"] >= min_f1 and r["precision"] >= min_precision and r["recall"] >= min_recall]
+    return max(passing, key=lambda r: r["rows_per_sec"], default=None)
+
+
+def results_frame(results):
+    return pd.DataFrame([{
+        "method": r["method"],
+        "params": ", ".join(f"{k}={v}" for k, v in r["params"].items()),
+        "precision": round(r["precision"], 3),
+        "recall": round(r["recall"], 3),
+        "f1": round(r["f1"], 3),
+        "event_recall": round(r["event_recall"], 3),
+        "rows/sec": int(r["rows_per_sec"]),
+    } for r in results])
+
+
+#----
+# CLI
+#----
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate anomaly detectors against injected events.")
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--mines", type=int, default=20)
+    parser.add_argument("--events", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--methods", nargs="+", choices=list(DEFAULT_GRID), default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=1, help="timing runs per configuration (best is kept)")
+    parser.add_argument("--min-effect", type=float, default=0.3,
+                        help="cells changed by more than this fraction count as true anomalies")
+    parser.add_argument("--min-f1", type=float, default=0.0)
+    parser.add_argument("--min-precision", type=float, default=0.0)
+    parser.add_argument("--min-recall", type=float, default=0.0)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results = run_evaluation(args.days, args.mines, args.events, args.seed, methods=args.methods,
+                             workers=args.workers, repeat=args.repeat, min_effect=args.min_effect)
+    print(results_frame(results).to_string(index=False))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"days": args.days, "mines": args.mines, "events": args.events,
+                       "seed": args.seed, "results": results}, f, indent=2)
+
+    best = cheapest(results, args.min_f1, args.min_precision, args.min_recall)
+    if best is None:
+        print("\nNo configuration meets the accuracy bar.")
+        return 1
+    params = ", ".join(f"{k}={v}" for k, v in best["params"].items())
+    print(f"\nCheapest configuration meeting the bar: {best['method']} ({params}) "
+          f"F1 {best['f1']:.3f}, {best['rows_per_sec']:.0f} rows/sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Script used for benchmarking the load -> stats -> detect -> plot -> PDF pipeline on synthetic data.
+Runs fully offline (data comes from data.generator).
+
+Examples:
+    python -m benchmarks.pipeline --rows 1000 10000 --mines 1 10 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.pipeline --baseline benchmarks/baseline.json --threshold 0.25
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from data.generator import generate_data
+from analysis.stats import calculate_stats, detect_anomalies
+from analysis.episodes import EpisodeIndex
+from analysis.fleet import fleet_scores
+from analysis.forecast import HoltWinters
+from analysis.rollup import RollupCube
+from charts.plotting import add_trendline, create_figure
+from charts.render import get_png_cache
+from pdf.report import generate_full_pdf
+
+DEFAULT_ROWS = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_MINES = [1, 10, 100, 1000]
+DETECT_METHODS = ["IQR", "z-score", "moving_avg", "rolling_mad", "grubbs"]
+# window sweep of the two sliding-window detectors (pandas mean per mine vs median filter)
+WINDOW_METHODS = {"moving_avg": "ma_window", "rolling_mad": "mad_window"}
+WINDOW_SIZES = [7, 91, 365]
+# plot and PDF only ever draw a handful of selected mines
+PLOT_MINES = 3
+
+
+#----------------
+# Benchmark cases
+#----------------
+def _mine_cols(df):
+    return [c for c in df.columns if c not in ("Date", "Total")]
+
+
+def _case_stats(df, ctx):
+    return lambda: calculate_stats(df)
+
+
+def _case_detect(method, **params):
+    def case(df, ctx):
+        return lambda: detect_anomalies(df, methods=[method], **params)
+    return case
+
+
+def _case_create_figure(df, ctx):
+    selected = _mine_cols(df)[:PLOT_MINES]
+    anomalies = ctx["anomalies"]
+    return lambda: create_figure(df, anomalies, selected, "line")
+
+
+def _case_add_trendline(df, ctx):
+    import plotly.graph_objects as go
+    mine = _mine_cols(df)[0]
+    dates, values = df["Date"], df[mine].values
+    return lambda: add_trendline(go.Figure(), dates, values, degree=3)
+
+
+def _case_pdf(df, ctx):
+    selected = _mine_cols(df)[:PLOT_MINES]
+    stats, anomalies, out_dir = ctx["stats"], ctx["anomalies"], ctx["out_dir"]
+    cache = get_png_cache()
+
+    def run():
+        # every run renders its charts (the warm-up would otherwise fill the PNG cache)
+        cache.clear()
+        return generate_full_pdf(df, stats, anomalies, [], selected, out_dir=out_dir)
+    return run
+
+
+def _case_rollup(df, ctx):
+    return lambda: RollupCube.build(df)
+
+
+def _case_fleet(df, ctx):
+    return lambda: fleet_scores(df)
+
+
+def _case_forecast(df, ctx):
+    return lambda: HoltWinters.fit(df).forecast(90)
+
+
+def _case_episode_index(df, ctx):
+    return lambda: EpisodeIndex.from_frame(ctx["anomalies"], df)
+
+
+def _case_episode_query(df, ctx):
+    # summary counts over the middle half of the data
+    episodes = EpisodeIndex.from_frame(ctx["anomalies"], df)
+    start, end = df["Date"].iloc[len(df) // 4], df["Date"].iloc[3 * len(df) // 4]
+    return lambda: (episodes.day_counts(start, end), episodes.unique_days(start, end))
+
+
+BENCHMARKS = {
+    "calculate_stats": _case_stats,
+    "rollup_build": _case_rollup,
+    **{f"detect_anomalies[{m}]": _case_detect(m) for m in DETECT_METHODS},
+    **{f"detect_anomalies[{m},window={w}]": _case_detect(m, **{param: w})
+       for m, param in WINDOW_METHODS.items() for w in WINDOW_SIZES},
+    "fleet_scores": _case_fleet,
+    "forecast": _case_forecast,
+    "episode_index": _case_episode_index,
+    "episode_query": _case_episode_query,
+    "create_figure": _case_create_figure,
+    "add_trendline": _case_add_trendline,
+    "generate_full_pdf": _case_pdf,
+}
+
+
+#--------
+# Runner
+#--------
+def _time_call(fn, repeat):
+    """
+    One run under tracemalloc for peak memory (also warms caches), then best wall time of `repeat` runs.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+
+    return best, peak
+
+
+def run_benchmarks(rows_grid=DEFAULT_ROWS, mines_grid=DEFAULT_MINES, targets=None,
+                   repeat=3, max_cells=20_000_000, seed=0, log=print):
+    """
+    Runs selected benchmarks over rows x mines grid. Grid points above max_cells are skipped.
+    Returns dict case_key -> {"seconds", "peak_mb", "rows", "mines", "target"}.
+    """
+    targets = targets or list(BENCHMARKS)
+    unknown = set(targets) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {sorted(unknown)}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for n_rows in rows_grid:
+            for n_mines in mines_grid:
+                if n_rows * n_mines > max_cells:
+                    log(f"skip rows={n_rows} mines={n_mines} (> max_cells)")
+                    continue
+
+                df = generate_data("2000-01-01", n_rows, n_mines, correlation=0.3,
+                                   dow_multipliers=[1, 1, 1, 1, 1, 0.8, 0.6], seed=seed)
+                ctx = {"out_dir": out_dir}
+                if {"create_figure", "generate_full_pdf", "episode_index", "episode_query"} & set(targets):
+                    ctx["anomalies"] = detect_anomalies(df, methods=["IQR", "z-score"])
+                    ctx["stats"] = calculate_stats(df)
+
+                for target in targets:
+                    seconds, peak = _time_call(BENCHMARKS[target](df, ctx), repeat)
+                    key = f"{target}|rows={n_rows}|mines={n_mines}"
+                    results[key] = {
+                        "target": target, "rows": n_rows, "mines": n_mines,
+                        "seconds": seconds, "peak_mb": peak / 1024 ** 2,
+                    }
+                    log(f"{key:<55} {seconds * 1000:10.1f} ms {peak / 1024 ** 2:10.1f} MB")
+
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=0.25, min_seconds=0.005):
+    """
+    Cases slower than baseline by more than threshold (fraction).
+    Cases under min_seconds in both runs are ignored as timer noise.
+    """
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if base is None or max(res["seconds"], base["seconds"]) < min_seconds:
+            continue
+        ratio = res["seconds"] / max(base["seconds"], 1e-12)
+        if ratio > 1 + threshold:
+            regressions.append((key, base["seconds"], res["seconds"], ratio))
+    return regressions
+
+
+def _environment():
+    return {"python": sys.version.split()[0], "numpy": np.__version__,
+            "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+#----
+# CLI
+#----
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard pipeline on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--mines", type=int, nargs="+", default=DEFAULT_MINES)
+    parser.add_argument("--targets", nargs="+", default=None, choices=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-cells", type=float, default=2e7, help="skip grid points with rows*mines above this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--save-baseline", help="write results as new baseline JSON")
+    parser.add_argument("--baseline", help="compare against baseline JSON")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rows, args.mines, args.targets, args.repeat,
+                             int(args.max_cells), args.seed)
+    payload = {"environment": _environment(), "results": results}
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(payload, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for key, old, new, ratio in regressions:
+                print(f"  {key}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms (x{ratio:.2f})")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Script used for downsampling chart series before they are sent to the browser.
+"""
+
+import numpy as np
+
+#------------------------------------
+# Largest-Triangle-Three-Buckets (LTTB)
+#------------------------------------
+def lttb_indices(x, y, n_out):
+    """
+    Indices of n_out points chosen by Largest-Triangle-Three-Buckets.
+    First and last points are always kept; x must be increasing and y finite.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # bucket i (0..n_out-3) covers edges[i]:edges[i+1], edges[-1] == n - 1
+    edges = (np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)) + 1).astype(int)
+    # bucket averages from cumulative sums; the bucket after the last one is point n-1
+    cx = np.concatenate([[0.0], np.cumsum(x)])
+    cy = np.concatenate([[0.0], np.cumsum(y)])
+    starts = edges[1:]
+    ends = np.append(edges[2:], n)
+    avg_x = (cx[ends] - cx[starts]) / (ends - starts)
+    avg_y = (cy[ends] - cy[starts]) / (ends - starts)
+
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        xa, ya = x[a], y[a]
+        area = np.abs((xa - avg_x[i]) * (y[lo:hi] - ya) - (xa - x[lo:hi]) * (avg_y[i] - ya))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+
+    return idx
+
+
+def downsample_indices(x, y, n_out, keep=None):
+    """
+    LTTB indices of a series (NaNs skipped) merged with indices that must stay
+    visible (e.g. anomaly markers). Returns sorted unique positional indices.
+    """
+    y = np.asarray(y, dtype=float)
+    if len(y) <= n_out:
+        return np.arange(len(y))
+
+    finite = np.flatnonzero(np.isfinite(y))
+    selected = finite[lttb_indices(np.asarray(x, dtype=float)[finite], y[finite], n_out)]
+    if keep is not None:
+        selected = np.union1d(selected, np.flatnonzero(keep))
+    return selected
+
+
+def bucket_means(y, n_out):
+    """
+    (first position, mean) of at most n_out consecutive equal-size buckets of y
+    (NaNs skipped). Bars are not thinned like lines: each bar stands for one bucket.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    starts = np.arange(0, n, max(1, -(-n // max(n_out, 1))))
+    if n == 0:
+        return starts, np.zeros(0)
+    finite = np.isfinite(y)
+    sums = np.add.reduceat(np.where(finite, y, 0.0), starts)
+    counts = np.add.reduceat(finite.astype(np.int64), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return starts, np.where(counts > 0, sums / counts, np.nan)
+
+
+def dates_to_float(dates):
+    """
+    Date column as float nanoseconds (LTTB needs numeric x).
+    """
+    return np.asarray(dates, dtype="datetime64[ns]").astype("int64").astype(float)
+
+
+#--------------------------------
+# Min/max per pixel (static PNGs)
+#--------------------------------
+def minmax_indices(y, n_buckets, keep=None):
+    """
+    Indices of the minimum and maximum of each of n_buckets consecutive buckets
+    (NaNs skipped), plus first/last point and `keep`. With one bucket per pixel
+    column a line through these points covers the same pixels as the full series.
+    """
+    y = np.asarray(y, dtype=float)
+    finite = np.flatnonzero(np.isfinite(y))
+    n = len(finite)
+    if n <= 2 * n_buckets or n_buckets < 1:
+        selected = finite
+    else:
+        values = y[finite]
+        first = np.arange(n_buckets) * n // n_buckets
+        bucket = np.repeat(np.arange(n_buckets), np.diff(np.r_[first, n]))
+        picks = [finite[[0, -1]]]
+        for reduce in (np.minimum, np.maximum):
+            hit = np.flatnonzero(values == reduce.reduceat(values, first)[bucket])
+            # first position reaching the bucket's extreme
+            _, first_hit = np.unique(bucket[hit], return_index=True)
+            picks.append(finite[hit[first_hit]])
+        selected = np.unique(np.concatenate(picks))
+    if keep is not None:
+        selected = np.union1d(selected, np.flatnonzero(keep))
+    return selected
@@ -6,28 +6,127 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
+from analysis.profiling import profiled
+from charts.downsample import bucket_means, dates_to_float, downsample_indices
+from charts.trend import evaluate_trends, fit_trends, trend_lines
+
+# default point budget per series (about 2 points per horizontal pixel)
+DEFAULT_MAX_POINTS = 2000
+# above this many rendered points, traces switch to WebGL (Scattergl)
+WEBGL_THRESHOLD = 20000
+
 #---------------
 # Plotting logic
 # --------------
-def add_trendline(fig, dates, series, degree, name_prefix="Trend"):
+def add_trendline(fig, dates, series, degree, name_prefix="Trend", eval_idx=None, scatter_cls=go.Scatter):
     # Fit polynomial to y over integer x (index) to avoid date numeric issues
-    x = np.arange(len(series))
+    series = np.asarray(series, dtype=float)
     # remove NaNs
     mask = ~np.isnan(series)
     if mask.sum() < degree+1:
         return fig
-    coeffs = np.polyfit(x[mask], series[mask], deg=degree)
-    p = np.poly1d(coeffs)
-    yfit = p(x)
+    coeffs = fit_trends(series, degree)
+    # evaluate only at rendered points when series is downsampled
+    yfit = evaluate_trends(coeffs, len(series), eval_idx)[:, 0]
+    if eval_idx is not None:
+        dates = np.asarray(dates)[eval_idx]
     # add as scatter
-    fig.add_trace(go.Scatter(x=dates, y=yfit, mode='lines', name=f"{name_prefix} (deg {degree})", line=dict(dash='dash')))
+    fig.add_trace(scatter_cls(x=dates, y=yfit, mode='lines', name=f"{name_prefix} (deg {degree})", line=dict(dash='dash')))
+    return fig
+
+
+def _add_trend_traces(fig, dates, trends, mines, degree, render_idx, scatter_cls):
+    """
+    Draws precomputed trend values (trend_lines output) for each mine.
+    """
+    for m in mines:
+        if m not in trends.columns or trends[m].isna().all():
+            continue
+        idx = render_idx.get(m)
+        fig.add_trace(scatter_cls(
+            x=_take(dates, idx), y=_take(trends[m], idx),
+            mode='lines', name=f"{m} trend (deg {degree})", line=dict(dash='dash')
+        ))
+    return fig
+
+
+def _add_forecast_traces(fig, forecasts, mines):
+    """
+    Draws forecast medians (dotted) and prediction interval bands
+    (analysis.forecast.HoltWinters.forecast output) for each mine.
+    """
+    for m in mines:
+        if m not in forecasts.columns:
+            continue
+        fig.add_trace(go.Scatter(
+            x=forecasts["Date"], y=forecasts[f"{m} upper"], mode="lines", line=dict(width=0),
+            showlegend=False, hoverinfo="skip"
+        ))
+        fig.add_trace(go.Scatter(
+            x=forecasts["Date"], y=forecasts[f"{m} lower"], mode="lines", line=dict(width=0),
+            fill="tonexty", fillcolor="rgba(128, 128, 128, 0.2)", name=f"{m} forecast interval"
+        ))
+        fig.add_trace(go.Scatter(
+            x=forecasts["Date"], y=forecasts[m], mode="lines", line=dict(dash="dot"),
+            name=f"{m} forecast"
+        ))
     return fig
 
 
+def _render_indices(df_view, anomalies_view, mines, max_points):
+    """
+    Positional indices to draw per mine (None = all). Anomalies are always kept.
+    """
+    if not max_points or len(df_view) <= max_points:
+        return {m: None for m in mines}
+
+    x = dates_to_float(df_view["Date"])
+    return {
+        m: downsample_indices(x, df_view[m].to_numpy(dtype=float), max_points,
+                              keep=anomalies_view[m].to_numpy(dtype=bool))
+        for m in mines
+    }
+
+
+def _bar_buckets(df_view, mines, max_points):
+    """
+    (bucket start positions, {mine: bucket means}) for a bar chart over max_points,
+    None when every day is drawn.
+    """
+    if not max_points or len(df_view) <= max_points:
+        return None
+    starts = None
+    means = {}
+    for m in mines:
+        starts, means[m] = bucket_means(df_view[m].to_numpy(dtype=float), max_points)
+    return starts, means
+
+
+def _take(values, idx):
+    return values if idx is None else values.iloc[idx]
+
+
+def _set_point_counts(fig, dropped):
+    """
+    Stores original vs rendered point counts in fig.layout.meta.
+    """
+    rendered = sum(len(t.x) for t in fig.data if t.x is not None)
+    fig.update_layout(meta={"points_original": int(rendered + dropped), "points_rendered": int(rendered)})
+    return fig
+
+
+@profiled("create_figure")
 def create_figure(df_view, anomalies_view, selected_mines, chart_type,
-                  show_trend=False, trend_degree=1):
+                  show_trend=False, trend_degree=1,
+                  max_points=None, webgl_threshold=WEBGL_THRESHOLD, trends=None, forecasts=None):
     """
     Creates a plotly figure for the dashboard.
+    - trends: fitted trend values per mine (charts.trend.trend_lines), fitted here if missing
+    - forecasts: forecast frame (analysis.forecast), drawn after the data on line/bar charts
+    - max_points: LTTB point budget per series (None = draw everything); bar charts
+      draw one bar per bucket of days (bucket mean) instead
+    - webgl_threshold: switch scatter traces to Scattergl above this many points
+    Point counts (before/after downsampling) are stored in fig.layout.meta.
     """
 
     # --- Stacked Chart ---
@@ -40,10 +139,19 @@ def create_figure(df_view, anomalies_view, selected_mines, chart_type,
                 xaxis_title="Date",
                 yaxis_title="Output",
             )
-            return fig
+            return _set_point_counts(fig, 0)
+
+        # stacked areas share x, so one index set (union over mines) is used
+        render_idx = _render_indices(df_view, anomalies_view, selected_mines, max_points)
+        idx = None
+        if any(i is not None for i in render_idx.values()):
+            idx = np.unique(np.concatenate(list(render_idx.values())))
+        df_plot = _take(df_view, idx)
+        dropped = (len(df_view) - len(df_plot)) * len(selected_mines)
+        scatter_cls = go.Scattergl if len(df_plot) * len(selected_mines) > webgl_threshold else go.Scatter
 
         fig = px.area(
-            df_view,
+            df_plot,
             x="Date",
             y=selected_mines,
             title="Stacked output (area)",
@@ -56,7 +164,7 @@ def create_figure(df_view, anomalies_view, selected_mines, chart_type,
             out_vals = df_view[m][anomalies_view[m]]
 
             if not out_dates.empty:
-                fig.add_trace(go.Scatter(
+                fig.add_trace(scatter_cls(
                     x=out_dates,
                     y=out_vals,
                     mode='markers',
@@ -68,26 +176,45 @@ def create_figure(df_view, anomalies_view, selected_mines, chart_type,
             legend=dict(orientation="h", yanchor="bottom", y=1.02,
                         xanchor="right", x=1)
         )
-        return fig
+        return _set_point_counts(fig, dropped)
 
     # --- Charts for 1 or many mines (line/bar) ---
     if len(selected_mines) == 0:
-        return go.Figure()
+        return _set_point_counts(go.Figure(), 0)
+
+    render_idx = _render_indices(df_view, anomalies_view, selected_mines, max_points)
+    bars = _bar_buckets(df_view, selected_mines, max_points) if chart_type == "bar" else None
+    if bars is not None:
+        # trends are drawn at the bucket starts
+        render_idx = {m: bars[0] for m in selected_mines}
+    rendered = sum(len(df_view) if i is None else len(i) for i in render_idx.values())
+    use_gl = rendered * (2 if show_trend else 1) > webgl_threshold
+    scatter_cls = go.Scattergl if use_gl else go.Scatter
+    traces_per_mine = 2 if show_trend else 1
+    dropped = (len(df_view) * len(selected_mines) - rendered) * traces_per_mine
+
+    if show_trend and trends is None:
+        trends = trend_lines(df_view, selected_mines, trend_degree)
 
     # --- Single mine ---
     if len(selected_mines) == 1:
         mine = selected_mines[0]
+        idx = render_idx[mine]
+        df_plot = _take(df_view, idx)
 
         if chart_type == "line":
-            fig = px.line(df_view, x="Date", y=mine, title=f"{mine} Output")
+            fig = px.line(df_plot, x="Date", y=mine, title=f"{mine} Output",
+                          render_mode="webgl" if use_gl else "auto")
         else:
-            fig = px.bar(df_view, x="Date", y=mine, title=f"{mine} Output")
+            if bars is not None:
+                df_plot = df_plot.assign(**{mine: bars[1][mine]})
+            fig = px.bar(df_plot, x="Date", y=mine, title=f"{mine} Output")
 
         # Outliers
         out_dates = df_view["Date"][anomalies_view[mine]]
         out_vals = df_view[mine][anomalies_view[mine]]
 
-        fig.add_trace(go.Scatter(
+        fig.add_trace(scatter_cls(
             x=out_dates,
             y=out_vals,
             mode="markers",
@@ -97,37 +224,38 @@ def create_figure(df_view, anomalies_view, selected_mines, chart_type,
 
         # Trendline
         if show_trend:
-            fig = add_trendline(
-                fig, df_view["Date"], df_view[mine].values,
-                degree=trend_degree,
-                name_prefix=f"{mine} trend"
-            )
+            fig = _add_trend_traces(fig, df_view["Date"], trends, [mine], trend_degree,
+                                    render_idx, scatter_cls)
+        if forecasts is not None:
+            fig = _add_forecast_traces(fig, forecasts, [mine])
 
         fig.update_layout(
             legend=dict(orientation="h", yanchor="bottom", y=1.02,
                         xanchor="right", x=1)
         )
-        return fig
+        return _set_point_counts(fig, dropped)
 
     # --- Multiple mines (overlay line/bar) ---
     fig = go.Figure()
 
     for m in selected_mines:
+        idx = render_idx[m]
         if chart_type == "line":
-            fig.add_trace(go.Scatter(
-                x=df_view["Date"], y=df_view[m],
+            fig.add_trace(scatter_cls(
+                x=_take(df_view["Date"], idx), y=_take(df_view[m], idx),
                 mode="lines", name=m
             ))
         else:
             fig.add_trace(go.Bar(
-                x=df_view["Date"], y=df_view[m], name=m
+                x=_take(df_view["Date"], idx),
+                y=_take(df_view[m], idx) if bars is None else bars[1][m], name=m
             ))
 
         # outliers
         out_dates = df_view["Date"][anomalies_view[m]]
         out_vals = df_view[m][anomalies_view[m]]
         if not out_dates.empty:
-            fig.add_trace(go.Scatter(
+            fig.add_trace(scatter_cls(
                 x=out_dates,
                 y=out_vals,
                 mode='markers',
@@ -135,10 +263,17 @@ def create_figure(df_view, anomalies_view, selected_mines, chart_type,
                 name=f"Outliers {m}"
             ))
 
+    # Trendlines for every selected mine (one batched fit)
+    if show_trend:
+        fig = _add_trend_traces(fig, df_view["Date"], trends, selected_mines, trend_degree,
+                                render_idx, scatter_cls)
+    if forecasts is not None:
+        fig = _add_forecast_traces(fig, forecasts, selected_mines)
+
     fig.update_layout(
         title="Mine Output Comparison",
         legend=dict(orientation="h", yanchor="bottom", y=1.02,
                     xanchor="right", x=1)
     )
 
-    return fig
\ No newline at end of file
+    return _set_point_counts(fig, dropped)
@@ -0,0 +1,166 @@
+"""
+Script used for rendering static PNG charts (PDF reports).
+
+Every chart gets its own Figure on an Agg canvas (no pyplot global state), so charts
+are rendered concurrently in a thread pool. Series are reduced to their min/max per
+pixel column before drawing, and rendered PNGs are cached per (data version, chart,
+date range, style), so a regenerated report only re-renders charts whose inputs changed.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from analysis.cache import AnalysisCache, dataset_version
+from analysis.profiling import profiled
+from charts.downsample import minmax_indices
+
+OVERVIEW = "overview"
+DEFAULT_STYLE = {"width": 10.0, "height": 4.0, "dpi": 150}
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+
+# PNGs of all reports in this process (LRU by size)
+_png_cache = AnalysisCache(max_bytes=64 * 1024 ** 2)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_png_cache():
+    return _png_cache
+
+
+def _render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="chart-render")
+        return _pool
+
+
+#--------------
+# Single chart
+#--------------
+def render_png(dates, series, style=None, title="", trends=None, markers=None, forecasts=None):
+    """
+    PNG bytes of a line chart.
+    - series: {label: values} aligned with dates
+    - trends: {label: fitted values}, drawn dashed in the series' color
+    - markers: {label: boolean mask} of anomalous days, drawn as red dots
+    - forecasts: forecast frame (analysis.forecast), median dotted with a shaded interval
+    """
+    style = {**DEFAULT_STYLE, **(style or {})}
+    fig = Figure(figsize=(style["width"], style["height"]), dpi=style["dpi"])
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    # one min/max pair per pixel column of the image is all a line can show
+    n_buckets = int(style["width"] * style["dpi"])
+    for label, values in series.items():
+        values = np.asarray(values, dtype=float)
+        keep = None if markers is None else markers.get(label)
+        idx = minmax_indices(values, n_buckets, keep=keep)
+        line, = ax.plot(dates[idx], values[idx], label=label, linewidth=1)
+        if trends is not None and label in trends:
+            step = max(1, len(dates) // n_buckets)
+            ax.plot(dates[::step], np.asarray(trends[label], dtype=float)[::step], linestyle="--",
+                    color=line.get_color(), label=f"{label} trend")
+        if keep is not None and keep.any():
+            ax.scatter(dates[keep], values[keep], color="red", s=8, zorder=3, label=f"{label} anomalies")
+        if forecasts is not None and label in forecasts.columns:
+            future = forecasts["Date"].to_numpy()
+            ax.fill_between(future, forecasts[f"{label} lower"], forecasts[f"{label} upper"],
+                            color=line.get_color(), alpha=0.2, linewidth=0)
+            ax.plot(future, forecasts[label], linestyle=":", color=line.get_color(), label=f"{label} forecast")
+
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Output")
+    ax.set_title(title)
+    ax.legend(loc="upper left", fontsize=8)
+    fig.tight_layout()
+    canvas.draw()
+
+    # saved without alpha: fpdf splits RGBA PNGs pixel by pixel, which dominates report time
+    buffer = io.BytesIO()
+    Image.fromarray(np.asarray(canvas.buffer_rgba())[..., :3]).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+#-----------------
+# Report charts
+#-----------------
+def _digest(array):
+    return hashlib.blake2b(np.ascontiguousarray(array).tobytes(), digest_size=8).hexdigest()
+
+
+@profiled("render_charts")
+def render_charts(df, mines, version=None, trends=None, episodes=None, style=None, cache=None,
+                  workers=None, forecasts=None):
+    """
+    {name: PNG bytes}: an overview of all mines (OVERVIEW) and one chart per mine.
+    Cached charts are reused; the others are rendered in parallel.
+    - version: dataset version of df (hashed from df when missing)
+    - episodes: EpisodeIndex over df's rows, anomalies are marked on per-mine charts
+    - style: figure width/height (inches) and dpi, plus anything else the caller
+      wants in the cache key (e.g. trend degree)
+    - workers: 1 renders in the calling thread, otherwise the shared render pool is used
+    - forecasts: forecast frame drawn after the data
+    """
+    mines = list(mines)
+    style = {**DEFAULT_STYLE, **(style or {})}
+    cache = _png_cache if cache is None else cache
+    if version is None:
+        version = dataset_version(df[["Date"] + mines])
+
+    dates = df["Date"].to_numpy()
+    window = (str(dates[0]), str(dates[-1]), len(dates)) if len(dates) else (0,)
+    style_key = tuple(sorted(style.items()))
+    trend_of = {} if trends is None else {m: trends[m].to_numpy() for m in mines if m in trends.columns}
+    forecast_of = {} if forecasts is None else {
+        m: forecasts[["Date", m, f"{m} lower", f"{m} upper"]] for m in mines if m in forecasts.columns
+    }
+
+    charts = {OVERVIEW: ({m: df[m].to_numpy() for m in mines}, "Mining Output (all selected mines)", None)}
+    for m in mines:
+        markers = None
+        if episodes is not None:
+            markers = np.zeros(len(df), dtype=bool)
+            markers[episodes.rows(m)] = True
+        charts[m] = ({m: df[m].to_numpy()}, f"{m} output", markers)
+
+    pngs, pending = {}, {}
+    for name, (series, title, markers) in charts.items():
+        chart_trends = {m: trend_of[m] for m in series if m in trend_of} or None
+        chart_forecasts = [forecast_of[m] for m in series if m in forecast_of]
+        chart_forecasts = pd.concat([chart_forecasts[0]] + [f.drop(columns="Date") for f in chart_forecasts[1:]],
+                                    axis=1) if chart_forecasts else None
+        key = ("chart_png", version, name, window, style_key, tuple(chart_trends or ()),
+               None if markers is None else _digest(np.flatnonzero(markers)),
+               None if chart_forecasts is None else _digest(chart_forecasts.drop(columns="Date").to_numpy(dtype=float)))
+        png = cache.get(key)
+        if png is not None:
+            pngs[name] = png
+            continue
+        mine_markers = None if markers is None else {name: markers}
+        pending[name] = (key, (dates, series, style, title, chart_trends, mine_markers, chart_forecasts))
+
+    if pending:
+        pool = _render_pool() if (workers or RENDER_WORKERS) > 1 and len(pending) > 1 else None
+        if pool is None:
+            results = {name: render_png(*args) for name, (_, args) in pending.items()}
+        else:
+            futures = {name: pool.submit(render_png, *args) for name, (_, args) in pending.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        for name, png in results.items():
+            cache.put(pending[name][0], png)
+            pngs[name] = png
+
+    return {name: pngs[name] for name in charts}
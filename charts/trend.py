@@ -0,0 +1,117 @@
+"""
+Script used for fitting polynomial trendlines for many mines at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analysis.profiling import profiled
+
+#---------------------
+# Batched trend fitting
+#---------------------
+def _vandermonde(n, degree, idx=None):
+    """
+    Vandermonde matrix over x scaled to [-1, 1] (well conditioned up to degree 4+).
+    """
+    x = np.arange(n, dtype=float) if idx is None else np.asarray(idx, dtype=float)
+    x = 2 * x / max(n - 1, 1) - 1
+    return np.vander(x, degree + 1, increasing=True)
+
+
+def fit_trends(values, degree):
+    """
+    Least-squares polynomial fit of every column of a 2D array against the row index.
+    Complete columns share one lstsq solve; columns with NaNs are solved together from
+    masked normal equations. Columns with fewer than degree+1 points get NaN coefficients.
+    Returns coefficients shaped (degree + 1, n_columns), x scaled to [-1, 1].
+    """
+    Y = np.asarray(values, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    n, m = Y.shape
+    coeffs = np.full((degree + 1, m), np.nan)
+    if n == 0:
+        return coeffs
+
+    V = _vandermonde(n, degree)
+    finite = np.isfinite(Y)
+    counts = finite.sum(axis=0)
+    complete = np.flatnonzero(counts == n)
+    partial = np.flatnonzero((counts < n) & (counts >= degree + 1))
+
+    if len(complete) and n >= degree + 1:
+        coeffs[:, complete] = np.linalg.lstsq(V, Y[:, complete], rcond=None)[0]
+
+    if len(partial):
+        M = finite[:, partial].astype(float)
+        Yp = np.where(finite[:, partial], Y[:, partial], 0.0)
+        A = np.einsum("ni,nj,nm->mij", V, V, M)       # V^T diag(mask) V per column
+        b = (V.T @ Yp).T[:, :, None]                   # V^T (mask * y) per column
+        coeffs[:, partial] = np.linalg.solve(A, b)[:, :, 0].T
+
+    return coeffs
+
+
+def evaluate_trends(coeffs, n, idx=None):
+    """
+    Fitted values (len(idx) or n rows x columns) for coefficients from fit_trends.
+    """
+    degree = coeffs.shape[0] - 1
+    return _vandermonde(n, degree, idx) @ coeffs
+
+
+#--------------
+# Cached trends
+#--------------
+def _window(df):
+    if len(df) == 0 or "Date" not in df.columns:
+        return (len(df),)
+    return (str(df["Date"].iloc[0]), str(df["Date"].iloc[-1]), len(df))
+
+
+def trend_coefficients(df, mines, degree, cache=None, version=None):
+    """
+    Coefficients per mine for df rows, shape (degree + 1, len(mines)).
+    With a cache, fits are stored per (data version, mine, degree, date window)
+    and only mines without a cached fit are solved (in one batch).
+    """
+    mines = list(mines)
+    coeffs = np.full((degree + 1, len(mines)), np.nan)
+    if cache is None:
+        if mines:
+            coeffs[:] = fit_trends(df[mines].to_numpy(dtype=float), degree)
+        return coeffs
+
+    if version is None:
+        from analysis.cache import dataset_version
+        version = dataset_version(df)
+
+    window = _window(df)
+    keys = [("trend", version, m, degree, window) for m in mines]
+    missing = []
+    for j, key in enumerate(keys):
+        cached = cache.get(key)
+        if cached is None:
+            missing.append(j)
+        else:
+            coeffs[:, j] = cached
+
+    if missing:
+        fitted = fit_trends(df[[mines[j] for j in missing]].to_numpy(dtype=float), degree)
+        for col, j in enumerate(missing):
+            coeffs[:, j] = fitted[:, col]
+            cache.put(keys[j], fitted[:, col].copy())
+
+    return coeffs
+
+
+@profiled("trend_lines")
+def trend_lines(df, mines, degree, cache=None, version=None):
+    """
+    Fitted trend values for all mines as a DataFrame aligned with df
+    (same index, one column per mine). Used by both Plotly chart and PDF.
+    """
+    mines = list(mines)
+    coeffs = trend_coefficients(df, mines, degree, cache=cache, version=version)
+    return pd.DataFrame(evaluate_trends(coeffs, len(df)), index=df.index, columns=mines)
@@ -0,0 +1,232 @@
+"""
+Script used for generating synthetic mine data in Python.
+NumPy port of regenData() from spreadsheet_logic.js, usable for large load-test datasets.
+
+Example:
+    python -m data.generator --mines 10000 --days 7300 --out data_cache/synthetic.parquet
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+#------------------
+# Model parameters
+#------------------
+def _normalize_params(distribution, p1, p2):
+    """
+    Same defaults and fixes as the Config sheet logic.
+    """
+    if distribution == "Uniform":
+        if p1 == 0 and p2 == 0:
+            p1, p2 = 40, 60
+        if p2 < p1:
+            p1, p2 = p2, p1
+    else:
+        if p1 == 0 and p2 == 0:
+            p1, p2 = 50, 20
+        if p2 <= 0:
+            p2 = max(1, abs(p1) * 0.2)
+    return p1, p2
+
+
+def _mine_names(mines):
+    if isinstance(mines, int):
+        return [f"Mine {i + 1}" for i in range(mines)]
+    return list(mines)
+
+
+def _chunk_days(n_mines, target_cells=1 << 22):
+    return max(1, target_cells // max(n_mines, 1))
+
+
+#----------------
+# Data generation
+#----------------
+def _iter_generated_arrays(start_date, days, n_mines,
+                           distribution="Normal", p1=50, p2=20,
+                           correlation=0.0, daily_growth=0.0,
+                           dow_multipliers=None, events=None,
+                           seed=None, chunk_days=None, dtype="float64"):
+    """
+    Yields (dates, values) array pairs for consecutive day chunks, values shaped (days, mines).
+    """
+    p1, p2 = _normalize_params(distribution, p1, p2)
+    dtype = np.dtype(dtype)
+    correlation = min(max(correlation, 0.0), 1.0)
+    chunk_days = chunk_days or _chunk_days(n_mines)
+
+    dow = np.ones(7)
+    if dow_multipliers is not None:
+        dow[:len(dow_multipliers)] = [m if m else 1 for m in dow_multipliers[:7]]
+
+    start = np.datetime64(pd.Timestamp(start_date).normalize().date(), "D")
+    parsed_events = []
+    for ev in events or []:
+        duration = int(ev.get("duration", 0))
+        if duration <= 0:
+            continue
+        parsed_events.append((
+            np.datetime64(pd.Timestamp(ev["date"]).normalize().date(), "D"),
+            duration,
+            float(ev.get("factor", 1.0)),
+            min(max(float(ev.get("prob", ev.get("probability", 0.0))), 0.0), 1.0),
+        ))
+
+    # separate streams so event draws do not shift value draws between chunk sizes
+    value_rng, event_rng = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(2)]
+    prev = None
+
+    for first in range(0, days, chunk_days):
+        n = min(chunk_days, days - first)
+        day_idx = np.arange(first, first + n)
+        dates = start + day_idx
+
+        # draws are made directly in the output dtype (float32 halves the work)
+        if distribution == "Uniform":
+            vals = value_rng.random((n, n_mines), dtype=dtype)
+            vals *= p2 - p1
+            vals += p1
+        else:
+            vals = value_rng.standard_normal((n, n_mines), dtype=dtype)
+            vals *= p2
+            vals += p1
+        np.abs(vals, out=vals)
+
+        # Day-of-week effect (1970-01-01 was a Thursday -> Monday = 0)
+        vals *= dow[(dates.astype("int64") + 3) % 7][:, None].astype(dtype)
+
+        # Correlation smoothing y[i] = (1-c) * x[i] + c * y[i-1], as a linear filter
+        if correlation > 0:
+            # first day is taken as is: (1-c)*x0 + c*x0 = x0
+            zi = correlation * (prev if prev is not None else vals[0])[None, :]
+            vals, _ = lfilter([1 - correlation], [1, -correlation], vals, axis=0, zi=zi)
+            vals = vals.astype(dtype, copy=False)
+        prev = vals[-1].copy()
+
+        # Exponential trend
+        vals *= ((1 + daily_growth) ** day_idx)[:, None].astype(dtype)
+
+        # Gaussian events
+        for ev_day, duration, factor, prob in parsed_events:
+            diff = (dates - ev_day).astype("int64")
+            hit = np.flatnonzero((diff >= 0) & (diff <= duration))
+            if len(hit) == 0:
+                continue
+            x = diff[hit] - duration / 2
+            sigma = max(duration / 4, 0.1)
+            mult = 1 + (factor - 1) * np.exp(-(x * x) / (2 * sigma * sigma))
+            applied = event_rng.random((len(hit), n_mines)) < prob
+            vals[hit] *= np.where(applied, mult[:, None], 1.0).astype(dtype)
+
+        vals[~np.isfinite(vals) | (vals < 0)] = 0
+        yield dates.astype("datetime64[ns]"), vals
+
+
+def iter_generated_chunks(start_date, days, mines, **kwargs):
+    """
+    Yields generated data as DataFrames of consecutive days (Date, mines..., Total).
+    - mines: number of mines or list of names
+    - distribution, p1, p2: "Normal" (mean, sd) or "Uniform" (min, max)
+    - correlation: smoothing with previous day, 0..1
+    - daily_growth: fraction per day (0.01 = 1%)
+    - dow_multipliers: 7 multipliers, Monday..Sunday
+    - events: list of dicts with date, duration, factor, prob (load_events format)
+    - seed, chunk_days, dtype
+    Output does not depend on chunk_days for a given seed.
+    """
+    names = _mine_names(mines)
+    for dates, vals in _iter_generated_arrays(start_date, days, len(names), **kwargs):
+        chunk = pd.DataFrame(vals, columns=names)
+        chunk.insert(0, "Date", dates)
+        chunk["Total"] = vals.sum(axis=1)
+        yield chunk
+
+
+def generate_data(start_date, days, mines, **kwargs):
+    """
+    Generates the whole dataset in memory. Same layout as load_data output.
+    """
+    return pd.concat(iter_generated_chunks(start_date, days, mines, **kwargs), ignore_index=True)
+
+
+def write_generated_data(path, start_date, days, mines, compression="snappy", **kwargs):
+    """
+    Streams generated chunks to Parquet, Arrow IPC (.arrow, memory-mappable by
+    data.store.open_store) or CSV, by file extension, without holding the whole
+    dataset in memory. Returns number of rows written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    rows = 0
+
+    if path.endswith(".csv"):
+        for i, chunk in enumerate(iter_generated_chunks(start_date, days, mines, **kwargs)):
+            chunk.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+            rows += len(chunk)
+        return rows
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    names = _mine_names(mines)
+    writer = None
+    try:
+        # Arrow table built straight from (transposed) arrays - a pandas frame with
+        # thousands of columns costs more than generating the data
+        for dates, vals in _iter_generated_arrays(start_date, days, len(names), **kwargs):
+            columns = np.ascontiguousarray(vals.T)
+            table = pa.Table.from_arrays(
+                [pa.array(dates)] + [pa.array(c) for c in columns] + [pa.array(vals.sum(axis=1))],
+                names=["Date"] + names + ["Total"],
+            )
+            if writer is None and path.endswith(".arrow"):
+                writer = pa.ipc.new_file(path, table.schema)
+            elif writer is None:
+                # random floats do not dictionary-encode, and per-column stats are
+                # only useful for Date (row-group pruning on date ranges)
+                writer = pq.ParquetWriter(path, table.schema, compression=compression,
+                                          use_dictionary=False, write_statistics=["Date"])
+            writer.write_table(table)
+            rows += len(dates)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+#----
+# CLI
+#----
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic mine output data.")
+    parser.add_argument("--out", required=True, help="output .parquet, .arrow or .csv path")
+    parser.add_argument("--mines", type=int, default=7)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--start", default="2020-01-01")
+    parser.add_argument("--distribution", choices=["Normal", "Uniform"], default="Normal")
+    parser.add_argument("--p1", type=float, default=50, help="mean (Normal) or min (Uniform)")
+    parser.add_argument("--p2", type=float, default=20, help="sd (Normal) or max (Uniform)")
+    parser.add_argument("--correlation", type=float, default=0.0)
+    parser.add_argument("--growth", type=float, default=0.0, help="daily growth in %%")
+    parser.add_argument("--dow", type=float, nargs=7, default=None, metavar="MULT",
+                        help="day-of-week multipliers, Monday..Sunday")
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    rows = write_generated_data(
+        args.out, args.start, args.days, args.mines,
+        distribution=args.distribution, p1=args.p1, p2=args.p2,
+        correlation=args.correlation, daily_growth=args.growth / 100,
+        dow_multipliers=args.dow, seed=args.seed, dtype=args.dtype,
+    )
+    print(f"Wrote {rows} rows x {args.mines} mines to {args.out} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,23 @@
 Script used for loading data and events from Google sheet.
 """
 
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import streamlit as st
 import pandas as pd
 import gspread
 import json
+from gspread.utils import absolute_range_name, rowcol_to_a1
 from google.oauth2.service_account import Credentials
 from collections.abc import Mapping
 
+from analysis.profiling import profiled
+from data.store import PRODUCTION_DTYPE, compact_frame, open_store, write_store
+
 #-----------------------------
 # Load data from Google Sheets
 #-----------------------------
@@ -46,103 +56,520 @@ def _normalize_sa_info(sa_info_raw):
     return sa_info
 
 
+SPREADSHEET_TITLE = "Weyland-Yutani Data Generator"
+EVENTS_RANGE = "B10:E50"
+
+# quota (429) and transient server errors are retried with exponential backoff
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+
+
+def _fail(message):
+    """
+    Shows message and stops the Streamlit run. Outside a Streamlit run st.stop()
+    does nothing, so the error is raised instead of returning None.
+    """
+    st.error(message)
+    st.stop()
+    raise RuntimeError(message)
+
+
+def build_gspread_client(sa_info):
+    """
+    gspread client for a service account, without Streamlit (used by headless scripts).
+    - sa_info: dict, JSON string or path to a service account JSON key file
+    Raises on missing or invalid credentials.
+    """
+    if isinstance(sa_info, str) and os.path.isfile(sa_info):
+        with open(sa_info) as f:
+            sa_info = f.read()
+    credentials = Credentials.from_service_account_info(_normalize_sa_info(sa_info), scopes=SCOPES)
+    return gspread.authorize(credentials)
+
+
+@st.cache_resource(show_spinner=False)
 def get_gspread_client():
     """
     Builds a gspread client using Streamlit secrets.
+    Cached once per process; google-auth session refreshes the access token itself.
     """
     if "gcp_service_account" not in st.secrets:
-        st.error("Missing [gcp_service_account] in Streamlit secrets.")
-        st.stop()
+        _fail("Missing [gcp_service_account] in Streamlit secrets.")
 
     try:
         sa_info = _normalize_sa_info(st.secrets["gcp_service_account"])
     except Exception as e:
-        st.error(f"Failed to parse gcp_service_account secret: {e}")
-        st.stop()
-
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
+        _fail(f"Failed to parse gcp_service_account secret: {e}")
 
     try:
-        credentials = Credentials.from_service_account_info(sa_info, scopes=scopes)
-        client = gspread.authorize(credentials)
-        return client
+        return build_gspread_client(sa_info)
     except Exception as e:
-        st.error(
+        _fail(
             "Failed to create Google credentials. Possible issues:\n"
             "- Wrong TOML formatting\n"
             "- Missing fields in service account\n"
             "- Incorrect private key formatting\n\n"
             f"Underlying error: {e}"
         )
-        st.stop()
 
 
-def load_data(sheet_name="Generated Data", json_key="secrets/service_account.json"):
+def _with_backoff(call, retries=MAX_RETRIES, base_delay=1.0, max_delay=32.0):
     """
-    Loads structured mine data only, ignoring randomizer/event columns.
+    call() retried on quota / transient API errors, waiting base_delay * 2^attempt
+    (capped, with jitter so concurrent readers do not retry in lockstep).
+    """
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except gspread.exceptions.APIError as e:
+            if e.code not in RETRY_STATUS or attempt == retries:
+                raise
+            time.sleep(min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+def _secret(name):
+    try:
+        return st.secrets.get(name)
+    except Exception:
+        return None
+
+
+@st.cache_resource(show_spinner=False)
+def open_spreadsheet(key=None, title=None):
+    """
+    Spreadsheet handle, opened by key, else by title (a Drive search), once per process.
+    Raises on failure. Without arguments: secret `spreadsheet_key` or SPREADSHEET_TITLE.
     """
     client = get_gspread_client()
+    if key is None and title is None:
+        key = _secret("spreadsheet_key")
+    if key:
+        return _with_backoff(lambda: client.open_by_key(key))
+    return _with_backoff(lambda: client.open(title or SPREADSHEET_TITLE))
+
+
+def get_spreadsheet():
+    """
+    Shared handle of the default spreadsheet; stops the app if it cannot be opened.
+    """
     try:
-        sheet = client.open("Weyland-Yutani Data Generator").worksheet(sheet_name)
+        return open_spreadsheet()
     except Exception as e:
-        st.error(f"Cannot open worksheet '{sheet_name}': {e}")
-        st.stop()
+        _fail(f"Cannot open spreadsheet '{_secret('spreadsheet_key') or SPREADSHEET_TITLE}': {e}")
+
+
+@st.cache_resource(show_spinner=False)
+def _events_sheet_title(key=None, title=None):
+    """
+    Title of first worksheet (events config). Needs metadata call, so cached.
+    """
+    spreadsheet = get_spreadsheet() if key is None and title is None else open_spreadsheet(key, title)
+    return _with_backoff(lambda: spreadsheet.sheet1.title)
 
-    raw_values = sheet.get_all_values()
-    if not raw_values or len(raw_values) < 2:
-        st.error("No data found in the sheet.")
-        st.stop()
 
-    headers = raw_values[0]
-    rows = raw_values[1:]
+@profiled("sheets_fetch")
+def fetch_ranges(ranges, spreadsheet=None):
+    """
+    Reads several A1 ranges in one API round trip (values:batchGet).
+    Returns list of value grids in the same order as ranges.
+    """
+    spreadsheet = spreadsheet or get_spreadsheet()
+    response = _with_backoff(lambda: spreadsheet.values_batch_get(ranges))
+    return [vr.get("values", []) for vr in response.get("valueRanges", [])]
+
 
-    clean_rows = []
-    for row in rows:
+def _first_blank_row(rows):
+    """
+    Index of the first row without any non-blank cell (len(rows) if there is none).
+    """
+    for i, row in enumerate(rows):
         if not any(cell.strip() for cell in row):
-            break
-        clean_rows.append(row)
+            return i
+    return len(rows)
+
 
-    valid_cols = []
-    for i, h in enumerate(headers):
+def _valid_columns(headers):
+    """
+    Leading data columns: up to the first blank, randomizer or event header.
+    """
+    valid = []
+    for h in headers:
         if h.strip() == "" or "Randomizer" in h or "Event" in h or h.startswith("Unnamed"):
             break
-        valid_cols.append(i)
+        valid.append(h)
+    return valid
 
-    clean_headers = [headers[i] for i in valid_cols]
-    trimmed_rows = [row[:len(valid_cols)] for row in clean_rows]
 
-    df = pd.DataFrame(trimmed_rows, columns=clean_headers)
+def _parse_columns(names, rows):
+    """
+    Typed column arrays (Date as datetime64[ns], the rest PRODUCTION_DTYPE) from raw rows.
+    Parsed column by column, so only one column of strings exists at a time;
+    sheets API drops trailing empty cells, so short rows read as "".
+    """
+    columns = {}
+    for j, name in enumerate(names):
+        cells = pd.Series([row[j] if j < len(row) else "" for row in rows], dtype=object)
+        if name == "Date":
+            columns[name] = pd.to_datetime(cells, errors="coerce").to_numpy(dtype="datetime64[ns]")
+        else:
+            columns[name] = pd.to_numeric(cells, errors="coerce").to_numpy(dtype=PRODUCTION_DTYPE)
+    return columns
 
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
 
-    for col in df.columns:
-        if col == "Date":
-            continue
-        df[col] = pd.to_numeric(df[col].replace("", pd.NA), errors="coerce")
+def _rows_to_frame(headers, rows):
+    """
+    Builds typed mine DataFrame from raw sheet rows. Stops at first blank row
+    and drops randomizer/event columns.
+    """
+    names = _valid_columns(headers)
+    columns = _parse_columns(names, rows[:_first_blank_row(rows)])
+    return compact_frame(pd.DataFrame(columns, columns=names))
 
-    return df
 
+#-------------------------
+# Paged streaming reader
+#-------------------------
+# rows per values:get request; keeps responses well under API size limits
+PAGE_ROWS = 5000
 
-#------------
-# Load events
-#------------
-def load_events(json_key="secrets/service_account.json"):
+
+def _page_range(sheet_name, first_row, n_rows, n_cols):
+    last_col = rowcol_to_a1(1, max(n_cols, 1)).rstrip("0123456789")
+    return absolute_range_name(sheet_name, f"A{first_row}:{last_col}{first_row + n_rows - 1}")
+
+
+def iter_sheet_chunks(sheet_name="Generated Data", headers=None, page_rows=PAGE_ROWS,
+                      first_page=None, spreadsheet=None):
     """
-    Load events from Google spreadsheet. Used to generate data into PDF.
+    Yields the worksheet's data rows as typed DataFrame chunks, one per page of
+    page_rows sheet rows. Only the data columns are requested, the next page is
+    fetched on a background thread while the current one is parsed, and reading
+    stops at the first blank row (or a short page = end of sheet).
+    - headers: header row when already fetched (otherwise read first)
+    - first_page: raw rows of sheet rows 2..page_rows+1 when already fetched
+    - spreadsheet: handle to read from (default spreadsheet when None)
     """
-    client = get_gspread_client()
+    spreadsheet = spreadsheet or get_spreadsheet()
+
+    def fetch(rng):
+        response = _with_backoff(lambda: spreadsheet.values_batch_get([rng]))
+        return response.get("valueRanges", [{}])[0].get("values", [])
+
+    if headers is None:
+        headers = (fetch(absolute_range_name(sheet_name, "1:1")) or [[]])[0]
+    names = _valid_columns(headers)
+    if not names:
+        return
 
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheet-prefetch")
     try:
-        sheet = client.open("Weyland-Yutani Data Generator").sheet1
+        first_row = 2
+        pending = pool.submit(fetch, _page_range(sheet_name, first_row, page_rows, len(names))) \
+            if first_page is None else None
+        while True:
+            rows = first_page if pending is None else pending.result()
+            first_page, pending = None, None
+
+            blank = _first_blank_row(rows)
+            last = blank < len(rows) or len(rows) < page_rows
+            if not last:
+                # next request is in flight while this page is parsed
+                first_row += page_rows
+                pending = pool.submit(fetch, _page_range(sheet_name, first_row, page_rows, len(names)))
+
+            if blank:
+                yield pd.DataFrame(_parse_columns(names, rows[:blank]), columns=names)
+            del rows
+            if last:
+                return
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+@profiled("sheets_stream")
+def read_sheet(sheet_name="Generated Data", headers=None, page_rows=PAGE_ROWS, first_page=None,
+               spreadsheet=None):
+    """
+    Whole worksheet as a compact frame, read page by page. Only one page of raw
+    strings is held at a time; typed pages are joined once at the end.
+    """
+    chunks = list(iter_sheet_chunks(sheet_name, headers, page_rows, first_page, spreadsheet))
+    if not chunks:
+        return compact_frame(pd.DataFrame(columns=_valid_columns(headers or [])))
+    names = list(chunks[0].columns)
+    columns = {}
+    for name in names:
+        columns[name] = np.concatenate([chunk[name].to_numpy() for chunk in chunks])
+        for chunk in chunks:
+            del chunk[name]
+    return compact_frame(pd.DataFrame(columns, columns=names))
+
+
+#----------------------------
+# Local snapshot (Arrow IPC)
+#----------------------------
+SNAPSHOT_PATH = "data_cache/generated_data.arrow"
+
+
+@profiled("snapshot_read")
+def _read_snapshot(snapshot_path):
+    """
+    Reads local snapshot (memory-mapped, read-only). Returns None if missing or unreadable.
+    """
+    if not snapshot_path or not os.path.exists(snapshot_path):
+        return None
+    try:
+        return open_store(snapshot_path)
+    except Exception:
+        return None
+
+
+def _write_snapshot(df, snapshot_path):
+    """
+    Writes snapshot atomically (temp file + rename) so a crashed rerun never leaves half a file.
+    """
+    if not snapshot_path:
+        return
+    write_store(df, snapshot_path)
+
+
+def _tail_ranges(sheet_name, snapshot):
+    """
+    A1 ranges for header row and rows after the snapshot. The last snapshot row
+    is re-read as an overlap row.
+    """
+    n = len(snapshot)
+    last_col = rowcol_to_a1(1, len(snapshot.columns)).rstrip("0123456789")
+    # row 1 = headers, snapshot rows live in sheet rows 2..n+1
+    return [
+        absolute_range_name(sheet_name, "1:1"),
+        absolute_range_name(sheet_name, f"A{n + 1}:{last_col}"),
+    ]
+
+
+def _parse_tail(snapshot, header_values, tail_values):
+    """
+    Parses tail fetched after the snapshot. If the overlap row no longer matches
+    (sheet was regenerated or edited), None is returned and caller does a full refresh.
+    """
+    if not header_values or not tail_values:
+        return None
+
+    overlap = _rows_to_frame(header_values[0], tail_values[:1])
+    if list(overlap.columns) != list(snapshot.columns) or overlap.empty:
+        return None
+
+    last_row = snapshot.iloc[[-1]].reset_index(drop=True)
+    if not overlap.equals(last_row.astype(overlap.dtypes.to_dict())):
+        return None
+
+    return _rows_to_frame(header_values[0], tail_values[1:])
+
+
+def _load_sheet(sheet_name, snapshot_path, full_refresh, events_range, spreadsheet=None):
+    """
+    (df, raw event rows) of one worksheet, reading only new rows when a snapshot
+    exists. Raises on API errors or an empty sheet (safe to run in worker threads).
+    """
+    events_ranges = [events_range] if events_range else []
+
+    snapshot = None if full_refresh else _read_snapshot(snapshot_path)
+    if snapshot is not None and len(snapshot) > 0:
+        try:
+            header_values, tail_values, *rest = fetch_ranges(
+                _tail_ranges(sheet_name, snapshot) + events_ranges, spreadsheet
+            )
+            tail = _parse_tail(snapshot, header_values, tail_values)
+        except Exception:
+            tail, rest = None, []
+
+        if tail is not None:
+            raw_events = rest[0] if events_ranges else None
+            if tail.empty:
+                return snapshot, raw_events
+            df = pd.concat([snapshot, tail], ignore_index=True)
+            _write_snapshot(df, snapshot_path)
+            return df, raw_events
+
+    # header, first page and events in one round trip, remaining pages streamed
+    header_values, first_page, *rest = fetch_ranges(
+        [absolute_range_name(sheet_name, "1:1"), absolute_range_name(sheet_name, f"2:{PAGE_ROWS + 1}")]
+        + events_ranges, spreadsheet
+    )
+    df = read_sheet(sheet_name, header_values[0], first_page=first_page,
+                    spreadsheet=spreadsheet) if header_values else None
+    if df is None or df.empty:
+        raise ValueError(f"No data found in worksheet '{sheet_name}'.")
+
+    _write_snapshot(df, snapshot_path)
+    return df, rest[0] if events_ranges else None
+
+
+@profiled("load_data")
+def load_data_and_events(sheet_name="Generated Data", snapshot_path=SNAPSHOT_PATH,
+                         full_refresh=False, with_events=True):
+    """
+    Loads mine data and events. Header, events and the first page of rows come in one
+    batched API call; a full read streams the remaining pages (iter_sheet_chunks).
+    - snapshot_path: local Arrow snapshot; only rows after its last Date are fetched
+    - full_refresh: ignore snapshot and re-read the whole worksheet
+    Returns (df, events); events is None when with_events is False.
+    """
+    events_range = absolute_range_name(_events_sheet_title(), EVENTS_RANGE) if with_events else None
+    try:
+        df, raw_events = _load_sheet(sheet_name, snapshot_path, full_refresh, events_range)
     except Exception as e:
-        st.error(f"Cannot open sheet1: {e}")
-        st.stop()
+        _fail(f"Cannot read worksheet '{sheet_name}': {e}")
+
+    events = _parse_events(raw_events) if with_events else None
+    return df, events
 
-    raw = sheet.get("B10:E50")
+
+def load_data(sheet_name="Generated Data", json_key="secrets/service_account.json",
+              snapshot_path=SNAPSHOT_PATH, full_refresh=False):
+    """
+    Loads structured mine data only, ignoring randomizer/event columns.
+    """
+    df, _ = load_data_and_events(sheet_name, snapshot_path=snapshot_path,
+                                 full_refresh=full_refresh, with_events=False)
+    return df
+
+
+def load_data_headless(credentials, key=None, title=None, sheet_name="Generated Data",
+                       snapshot_path=SNAPSHOT_PATH, full_refresh=False, with_events=True):
+    """
+    load_data_and_events without Streamlit (no secrets, caches or st.stop): the client
+    is built from a service account key and every failure raises.
+    - credentials: service account dict, JSON string or path to the JSON key file
+    - key / title: spreadsheet to open (default SPREADSHEET_TITLE)
+    """
+    client = build_gspread_client(credentials)
+    if key:
+        spreadsheet = _with_backoff(lambda: client.open_by_key(key))
+    else:
+        spreadsheet = _with_backoff(lambda: client.open(title or SPREADSHEET_TITLE))
+
+    events_range = None
+    if with_events:
+        events_range = absolute_range_name(_with_backoff(lambda: spreadsheet.sheet1.title), EVENTS_RANGE)
+    df, raw_events = _load_sheet(sheet_name, snapshot_path, full_refresh, events_range, spreadsheet)
+    return df, _parse_events(raw_events) if with_events else None
+
+
+#--------------------
+# Multi-site loading
+#--------------------
+SITE_WORKERS = 8
+SITE_COLUMN = "Site"
+
+
+def configured_sources():
+    """
+    Sites from the `sites` secret (list of tables with site, key or title, and
+    optional worksheet). None when a single spreadsheet is used.
+    """
+    sites = _secret("sites")
+    if not sites:
+        return None
+    return [dict(site) for site in sites]
+
+
+def _source_snapshot(source):
+    name = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(source["site"]))
+    return source.get("snapshot_path", f"data_cache/site_{name}.arrow")
+
+
+def merge_sites(frames, layout="wide"):
+    """
+    One frame from per-site frames ({site: df}).
+    - wide: rows aligned on the union of dates, columns "<site> / <mine>",
+      Total recomputed over all sites (site Totals dropped)
+    - long: sites stacked with a Site column (categorical), rows sorted by Date then site
+    """
+    frames = {site: df for site, df in frames.items() if df is not None and len(df)}
+    if not frames:
+        return compact_frame(pd.DataFrame({"Date": pd.Series(dtype="datetime64[ns]")}))
+
+    if layout == "long":
+        df = pd.concat([df.assign(**{SITE_COLUMN: site}) for site, df in frames.items()], ignore_index=True)
+        df[SITE_COLUMN] = pd.Categorical(df[SITE_COLUMN], categories=list(frames))
+        df = df.sort_values(["Date", SITE_COLUMN], kind="stable", ignore_index=True)
+        return df[["Date", SITE_COLUMN] + [c for c in df.columns if c not in ("Date", SITE_COLUMN)]]
+
+    dates = np.unique(np.concatenate([df["Date"].to_numpy(dtype="datetime64[ns]") for df in frames.values()]))
+    columns = {"Date": dates}
+    for site, df in frames.items():
+        rows = np.searchsorted(dates, df["Date"].to_numpy(dtype="datetime64[ns]"))
+        for mine in df.columns:
+            if mine in ("Date", "Total"):
+                continue
+            values = np.full(len(dates), np.nan, dtype=PRODUCTION_DTYPE)
+            values[rows] = df[mine].to_numpy(dtype=PRODUCTION_DTYPE)
+            columns[f"{site} / {mine}"] = values
+    df = pd.DataFrame(columns)
+    mines = [c for c in df.columns if c != "Date"]
+    df["Total"] = df[mines].sum(axis=1, min_count=1).astype(PRODUCTION_DTYPE)
+    return compact_frame(df)
+
+
+@profiled("load_sites")
+def load_sites(sources, full_refresh=False, with_events=True, layout="wide", max_workers=SITE_WORKERS):
+    """
+    Loads several sites concurrently and merges them (merge_sites). Each source is
+    a dict with site, key or title (spreadsheet) and optional worksheet / snapshot_path.
+    Spreadsheets are opened here (cached per process), the worksheets are read in a
+    bounded thread pool, so total time is close to the slowest site.
+    Returns (df, events, errors): events carry a "site" field, errors maps sites
+    that could not be read to their error message.
+    """
+    errors, handles = {}, {}
+    for source in sources:
+        try:
+            handles[source["site"]] = (
+                open_spreadsheet(source.get("key"), source.get("title")),
+                absolute_range_name(_events_sheet_title(source.get("key"), source.get("title")),
+                                    EVENTS_RANGE) if with_events else None,
+            )
+        except Exception as e:
+            errors[source["site"]] = str(e)
+
+    results = {}
+    if handles:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(handles)),
+                                thread_name_prefix="site-load") as pool:
+            futures = {
+                source["site"]: pool.submit(
+                    _load_sheet, source.get("worksheet", "Generated Data"), _source_snapshot(source),
+                    full_refresh, handles[source["site"]][1], handles[source["site"]][0]
+                )
+                for source in sources if source["site"] in handles
+            }
+            for site, future in futures.items():
+                try:
+                    results[site] = future.result()
+                except Exception as e:
+                    errors[site] = str(e)
+
+    df = merge_sites({site: result[0] for site, result in results.items()}, layout)
+    events = None
+    if with_events:
+        events = [{**ev, "site": site} for site, (_, raw) in results.items() for ev in _parse_events(raw or [])]
+    return df, events, errors
+
+
+#------------
+# Load events
+#------------
+def _parse_events(raw):
+    """
+    Parses raw B10:E50 rows into event dicts. Incomplete rows are skipped.
+    """
     events = []
 
     for row in raw:
@@ -170,3 +597,16 @@ def load_events(json_key="secrets/service_account.json"):
             continue
 
     return events
+
+
+@profiled("load_events")
+def load_events(json_key="secrets/service_account.json"):
+    """
+    Load events from Google spreadsheet. Used to generate data into PDF.
+    """
+    try:
+        raw, = fetch_ranges([absolute_range_name(_events_sheet_title(), EVENTS_RANGE)])
+    except Exception as e:
+        _fail(f"Cannot open sheet1: {e}")
+
+    return _parse_events(raw)
@@ -0,0 +1,145 @@
+"""
+Script used for keeping mine data compact in memory and on disk.
+
+- production columns as float32, Date as sorted datetime64[ns]
+- anomaly masks bit-packed (1 bit per cell instead of 1 byte)
+- Arrow IPC files read through a memory map: columns are used in place, without parsing
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+PRODUCTION_DTYPE = np.float32
+
+# number of set bits per byte value, used to count packed masks without unpacking
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+#--------------
+# Compact frame
+#--------------
+def _production_cols(df):
+    return [
+        col for col in df.columns
+        if col != "Date" and pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+    ]
+
+
+def compact_frame(df, dtype=PRODUCTION_DTYPE):
+    """
+    Production columns cast to dtype, Date to datetime64[ns] and rows sorted by Date.
+    Columns already in the target dtype are not copied.
+    """
+    if "Date" in df.columns:
+        if not pd.api.types.is_datetime64_dtype(df["Date"]) or df["Date"].dtype != "datetime64[ns]":
+            df = df.assign(Date=pd.to_datetime(df["Date"], errors="coerce").astype("datetime64[ns]"))
+        if not df["Date"].is_monotonic_increasing:
+            df = df.sort_values("Date", kind="stable").reset_index(drop=True)
+
+    casts = {col: dtype for col in _production_cols(df) if df[col].dtype != dtype}
+    if casts:
+        df = df.astype(casts)
+    return df
+
+
+def date_bounds(dates, start=None, end=None):
+    """
+    Positional [lo, hi) rows with start <= Date <= end, by binary search on sorted dates.
+    """
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start), "ns"), side="left")
+    hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end), "ns"), side="right")
+    return int(lo), int(max(hi, lo))
+
+
+#---------------------
+# Bit-packed masks
+#---------------------
+class PackedMask:
+    """
+    Boolean rows x columns mask stored column-major with 8 rows per byte.
+    """
+
+    def __init__(self, bits, n_rows, columns, index=None):
+        self.bits = bits
+        self.n_rows = n_rows
+        self.columns = list(columns)
+        self.index = index
+
+    @classmethod
+    def from_array(cls, mask, columns, index=None):
+        mask = np.asarray(mask, dtype=bool)
+        return cls(np.packbits(mask.T, axis=1), mask.shape[0], columns, index)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls.from_array(df.to_numpy(dtype=bool), df.columns, df.index)
+
+    def to_array(self):
+        """
+        Unpacked (n_rows, n_columns) boolean array.
+        """
+        return np.unpackbits(self.bits, axis=1, count=self.n_rows).T.view(bool)
+
+    def to_frame(self):
+        index = self.index if self.index is not None else pd.RangeIndex(self.n_rows)
+        return pd.DataFrame(self.to_array(), index=index, columns=self.columns)
+
+    def count(self):
+        """
+        Number of set cells per column.
+        """
+        return pd.Series(_POPCOUNT[self.bits].sum(axis=1), index=self.columns)
+
+    def __or__(self, other):
+        if other.columns != self.columns or other.n_rows != self.n_rows:
+            raise ValueError("Cannot combine masks of different shape.")
+        return PackedMask(self.bits | other.bits, self.n_rows, self.columns, self.index)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+
+#-------------------------------
+# Memory-mapped Arrow IPC store
+#-------------------------------
+def write_store(df, path):
+    """
+    Writes df as an uncompressed Arrow IPC file (atomic: temp file + rename).
+    NaNs are stored as NaN (not null) so float columns map back without a copy.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    table = pa.Table.from_arrays(
+        [pa.array(df[col].to_numpy()) for col in df.columns],
+        names=[str(col) for col in df.columns],
+    )
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def open_store(path):
+    """
+    Opens an Arrow IPC file through a memory map. Numeric and Date columns are
+    read-only views of the mapped file, pages are loaded by the OS on first access.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    # one block per column keeps columns zero-copy (no consolidation into 2D blocks)
+    return table.to_pandas(split_blocks=True)
+
+
+def read_frame(path, dtype=PRODUCTION_DTYPE):
+    """
+    Compact frame from .arrow/.feather (memory-mapped), .parquet or .csv.
+    """
+    if path.endswith((".arrow", ".feather", ".ipc")):
+        return compact_frame(open_store(path), dtype)
+    if path.endswith(".csv"):
+        return compact_frame(pd.read_csv(path, parse_dates=["Date"]), dtype)
+    return compact_frame(pd.read_parquet(path, memory_map=True), dtype)
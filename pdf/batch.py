@@ -0,0 +1,272 @@
+"""
+Script used for generating many PDF reports headlessly (no Streamlit server), e.g. monthly reports for every mine.
+
+The dataset is loaded and anomaly masks are computed once in the parent process,
+written to .npy files and memory-mapped by every worker, so workers neither reload
+nor recompute them. A manifest.json with per-report timings is written next to the PDFs.
+
+Examples:
+    python -m pdf.batch --input data_cache/generated_data.parquet --period monthly --out reports/
+    python -m pdf.batch --period quarterly --mine-sets all --workers 8 --out reports/ \
+        --credentials secrets/service_account.json
+"""
+
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from analysis.episodes import EpisodeIndex
+from analysis.profiling import Profiler, activate, deactivate
+from analysis.stats import _numeric_cols, calculate_stats, detect_anomalies
+from data.store import read_frame
+from pdf.report import generate_pdf_bytes
+
+PERIOD_FREQ = {"monthly": "MS", "quarterly": "QS", "yearly": "YS"}
+CREDENTIALS_ENV = "GOOGLE_APPLICATION_CREDENTIALS"
+
+# worker process state, filled by _init_worker
+_shared = {}
+
+
+#----------------
+# Input / matrix
+#----------------
+def _load_source(input_path, credentials=None, spreadsheet_key=None):
+    """
+    Data from a local Arrow/Parquet/CSV file, or from the Google Sheet using a
+    service account key file (credentials, else $GOOGLE_APPLICATION_CREDENTIALS).
+    """
+    if input_path:
+        return read_frame(input_path), []
+
+    credentials = credentials or os.environ.get(CREDENTIALS_ENV)
+    if not credentials:
+        raise ValueError(f"Reading the Google Sheet needs --credentials or ${CREDENTIALS_ENV} "
+                         "(service account JSON key file); use --input for a local file.")
+    from data.loader import load_data_headless
+    return load_data_headless(credentials, key=spreadsheet_key)
+
+
+def period_ranges(dates, period, start=None, end=None):
+    """
+    (start, end) inclusive date ranges covering the data, one per period.
+    """
+    first = pd.Timestamp(start) if start else dates.min()
+    last = pd.Timestamp(end) if end else dates.max()
+    if period == "all":
+        return [(first, last)]
+
+    starts = pd.date_range(first.to_period(PERIOD_FREQ[period][0]).start_time, last, freq=PERIOD_FREQ[period])
+    ranges = []
+    for s in starts:
+        e = (s + pd.tseries.frequencies.to_offset(PERIOD_FREQ[period])) - pd.Timedelta(days=1)
+        ranges.append((max(s, first), min(e, last)))
+    return ranges
+
+
+def mine_sets(mines, mode):
+    sets = []
+    if mode in ("per-mine", "both"):
+        sets += [[m] for m in mines]
+    if mode in ("all", "both"):
+        sets.append(list(mines))
+    return sets
+
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", text).strip("_")
+
+
+#---------------
+# Shared arrays
+#---------------
+def _export_shared(df, anomalies, cols, events, tmp_dir):
+    """
+    Writes dates, values and anomaly masks as .npy files for memory-mapping in workers.
+    """
+    paths = {
+        "dates": os.path.join(tmp_dir, "dates.npy"),
+        "values": os.path.join(tmp_dir, "values.npy"),
+        "anomalies": os.path.join(tmp_dir, "anomalies.npy"),
+    }
+    np.save(paths["dates"], df["Date"].to_numpy(dtype="datetime64[ns]"))
+    np.save(paths["values"], df[cols].to_numpy(dtype=np.result_type(*df[cols].dtypes)))
+    np.save(paths["anomalies"], anomalies[cols].to_numpy(dtype=bool))
+    return {"paths": paths, "columns": cols, "events": events}
+
+
+def _init_worker(shared):
+    """
+    Memory-maps the shared arrays once per worker process.
+    """
+    paths = shared["paths"]
+    dates = np.load(paths["dates"], mmap_mode="r")
+    values = np.load(paths["values"], mmap_mode="r")
+    masks = np.load(paths["anomalies"], mmap_mode="r")
+    _shared["dates"] = dates
+    _shared["values"] = values
+    _shared["anomalies"] = masks
+    _shared["columns"] = shared["columns"]
+    _shared["events"] = shared["events"]
+
+
+def _render_report(task):
+    """
+    Builds one report from the shared arrays. Runs in a worker process.
+    """
+    t0 = time.perf_counter()
+    dates = _shared["dates"]
+    lo = np.searchsorted(dates, np.datetime64(task["start"], "ns"), side="left")
+    hi = np.searchsorted(dates, np.datetime64(task["end"], "ns"), side="right")
+
+    cols = _shared["columns"]
+    df = pd.DataFrame(np.asarray(_shared["values"][lo:hi]), columns=cols)
+    df.insert(0, "Date", np.asarray(dates[lo:hi]))
+    episodes = EpisodeIndex.from_frame(pd.DataFrame(np.asarray(_shared["anomalies"][lo:hi]), columns=cols), df)
+
+    result = {**task, "rows": int(hi - lo), "status": "ok", "error": None}
+    if hi <= lo:
+        result.update(status="skipped", error="no data in range", seconds=time.perf_counter() - t0)
+        return result
+
+    profiler = Profiler()
+    token = activate(profiler)
+    try:
+        events = [ev for ev in _shared["events"]
+                  if task["start"] <= pd.Timestamp(ev["date"]) <= task["end"]]
+        pdf_bytes = generate_pdf_bytes(
+            df=df,
+            stats_df=calculate_stats(df),
+            anomalies=episodes,
+            events=events,
+            selected_mines=task["mines"],
+            chart_type="line",
+            trend_degree=task["trend_degree"],
+            show_trend=task["show_trend"],
+            # reports already run one per process
+            chart_workers=1,
+        )
+        with open(task["path"], "wb") as f:
+            f.write(pdf_bytes)
+        result["anomalies"] = int(episodes.day_counts(mines=task["mines"]).sum())
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+    finally:
+        deactivate(token)
+
+    result["seconds"] = time.perf_counter() - t0
+    result["stages"] = {st["stage"]: round(st["seconds"], 4) for st in profiler.summary()}
+    return result
+
+
+#--------
+# Runner
+#--------
+def run_batch(out_dir, input_path=None, period="monthly", mine_set_mode="per-mine", mines=None,
+              start=None, end=None, methods=("IQR", "z-score"), workers=None,
+              trend_degree=1, show_trend=False, detect_params=None, credentials=None,
+              spreadsheet_key=None, log=print):
+    """
+    Generates the (mine set x period) report matrix in a process pool.
+    Without input_path the data comes from the Google Sheet (credentials: service account key file).
+    Returns manifest dict (also written to out_dir/manifest.json).
+    """
+    t_start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    df, events = _load_source(input_path, credentials, spreadsheet_key)
+    load_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    cols = _numeric_cols(df)
+    anomalies = detect_anomalies(df, methods=list(methods), **(detect_params or {}))
+    detect_seconds = time.perf_counter() - t0
+
+    selected = [m for m in (mines or [c for c in cols if c != "Total"]) if m in cols]
+    tasks = []
+    for mine_set in mine_sets(selected, mine_set_mode):
+        label = mine_set[0] if len(mine_set) == 1 else "all_mines"
+        for s, e in period_ranges(df["Date"], period, start, end):
+            name = f"{_slug(label)}_{s:%Y-%m-%d}_{e:%Y-%m-%d}.pdf"
+            tasks.append({
+                "mines": mine_set, "start": s, "end": e, "path": os.path.join(out_dir, name),
+                "trend_degree": trend_degree, "show_trend": show_trend,
+            })
+
+    log(f"Loaded {len(df)} rows in {load_seconds:.1f}s, anomalies in {detect_seconds:.1f}s; "
+        f"{len(tasks)} reports to build")
+
+    reports = []
+    with tempfile.TemporaryDirectory(prefix="wy_batch_") as tmp_dir:
+        shared = _export_shared(df, anomalies, cols, events, tmp_dir)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            futures = [pool.submit(_render_report, task) for task in tasks]
+            for i, future in enumerate(as_completed(futures), start=1):
+                res = future.result()
+                reports.append({
+                    "file": os.path.basename(res["path"]), "mines": res["mines"],
+                    "start": f"{res['start']:%Y-%m-%d}", "end": f"{res['end']:%Y-%m-%d}",
+                    "rows": res["rows"], "anomalies": res.get("anomalies"),
+                    "status": res["status"], "error": res["error"], "seconds": round(res["seconds"], 3),
+                    "stages": res.get("stages", {}),
+                })
+                log(f"[{i}/{len(tasks)}] {reports[-1]['file']} {res['status']} {res['seconds']:.2f}s")
+
+    reports.sort(key=lambda r: r["file"])
+    manifest = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "input": input_path or "google-sheet",
+        "period": period,
+        "methods": list(methods),
+        "load_seconds": round(load_seconds, 3),
+        "detect_seconds": round(detect_seconds, 3),
+        "total_seconds": round(time.perf_counter() - t_start, 3),
+        "reports": reports,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+#----
+# CLI
+#----
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate PDF reports for every mine and period.")
+    parser.add_argument("--out", default="pdf_reports/batch", help="output directory")
+    parser.add_argument("--input", help="Arrow/Parquet/CSV with Date + mine columns (default: Google Sheet)")
+    parser.add_argument("--credentials", help=f"service account JSON key file for the Google Sheet "
+                                              f"(default: ${CREDENTIALS_ENV})")
+    parser.add_argument("--spreadsheet-key", help="spreadsheet key (default: open by title)")
+    parser.add_argument("--period", choices=["monthly", "quarterly", "yearly", "all"], default="monthly")
+    parser.add_argument("--mine-sets", choices=["per-mine", "all", "both"], default="per-mine")
+    parser.add_argument("--mines", nargs="+", help="restrict to these mines")
+    parser.add_argument("--start", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date (YYYY-MM-DD)")
+    parser.add_argument("--methods", nargs="+", default=["IQR", "z-score"],
+                        choices=["IQR", "z-score", "moving_avg", "rolling_mad", "grubbs"])
+    parser.add_argument("--trend-degree", type=int, default=0, help="draw trendlines of this degree (0 = off)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    manifest = run_batch(
+        args.out, input_path=args.input, period=args.period, mine_set_mode=args.mine_sets,
+        mines=args.mines, start=args.start, end=args.end, methods=args.methods, workers=args.workers,
+        trend_degree=max(args.trend_degree, 1), show_trend=args.trend_degree > 0,
+        credentials=args.credentials, spreadsheet_key=args.spreadsheet_key,
+    )
+    failed = [r for r in manifest["reports"] if r["status"] == "failed"]
+    print(f"{len(manifest['reports'])} reports in {manifest['total_seconds']:.1f}s, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
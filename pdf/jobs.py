@@ -0,0 +1,140 @@
+"""
+Script used for building PDF reports in background worker threads.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis.profiling import Profiler, activate, deactivate
+from pdf.report import generate_pdf_bytes
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def report_key(data_version, **params):
+    """
+    De-duplication key of a report: data version plus report parameters.
+    """
+    payload = json.dumps({"data": data_version, **params}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+#-----------
+# Report job
+#-----------
+class ReportJob:
+    """
+    Status of one report build. Fields are updated by the worker thread.
+    """
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.profile = Profiler()
+
+    def _update(self, fraction, message):
+        self.progress = fraction
+        self.message = message
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    @property
+    def seconds(self):
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def info(self):
+        return {"id": self.id, "status": self.status, "progress": self.progress,
+                "message": self.message, "error": self.error, "seconds": self.seconds}
+
+
+#------------
+# Job queue
+#------------
+class ReportJobQueue:
+    """
+    Worker pool for PDF reports. Identical requests (same key) share one job;
+    finished jobs are kept in an LRU of `max_results` entries for re-downloads.
+    """
+
+    def __init__(self, max_workers=2, max_results=16):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf-report")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_key = OrderedDict()
+        self.max_results = max_results
+
+    def submit(self, key, **report_kwargs):
+        """
+        Queues generate_pdf_bytes(**report_kwargs) unless a job with the same key
+        is already queued, running or done. Returns the ReportJob.
+        """
+        with self._lock:
+            job_id = self._by_key.get(key)
+            if job_id is not None:
+                job = self._jobs[job_id]
+                if job.status != FAILED:
+                    self._by_key.move_to_end(key)
+                    return job
+
+            job = ReportJob(key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            self._evict()
+
+        self._executor.submit(self._run, job, report_kwargs)
+        return job
+
+    def _run(self, job, report_kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        job._update(0.0, "Started")
+        token = activate(job.profile)
+        try:
+            job.result = generate_pdf_bytes(progress=job._update, **report_kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+            job.message = "Failed"
+        finally:
+            deactivate(token)
+            job.finished_at = time.time()
+
+    def _evict(self):
+        # drop oldest finished jobs beyond max_results (running ones are kept)
+        while len(self._by_key) > self.max_results:
+            for key, job_id in self._by_key.items():
+                if self._jobs[job_id].done:
+                    del self._by_key[key]
+                    del self._jobs[job_id]
+                    break
+            else:
+                return
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        job = self.get(job_id)
+        return None if job is None else job.info()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -3,52 +3,57 @@ Script used for generating PDF report from dashboard.
 """
 
 import os
+import tempfile
 import pandas as pd
-import matplotlib.pyplot as plt
 from fpdf import FPDF
 
-#--------------
-# PDF Generator
-#--------------
-def render_matplotlib_plot(df_view, selected_mines, out_path="chart_matplotlib.png"):
-    """
-    Saving chart using matplotlib.
-    """
-    plt.figure(figsize=(10, 4))
-
-    for m in selected_mines:
-        plt.plot(df_view["Date"], df_view[m], label=m)
-
-    plt.xlabel("Date")
-    plt.ylabel("Output")
-    plt.title("Mining Output (matplotlib export)")
-    plt.legend()
-    plt.tight_layout()
+from analysis.episodes import EpisodeIndex
+from analysis.profiling import profiled
+from charts.render import OVERVIEW, render_charts
+from charts.trend import trend_lines
 
-    plt.savefig(out_path, dpi=150)
-    plt.close()
-
-    return out_path
+# episodes listed per mine (the most extreme ones, in date order)
+MAX_EPISODES_PER_MINE = 40
 
 
+#--------------
+# PDF Generator
+#--------------
+@profiled("generate_full_pdf")
 def generate_full_pdf(df, stats_df, anomalies, events, selected_mines,
-                      out_dir="pdf_reports", chart_type="line", trend_degree=1):
+                      out_dir="pdf_reports", chart_type="line", trend_degree=1,
+                      show_trend=False, trends=None, progress=None, version=None, chart_workers=None,
+                      forecasts=None):
     """
     Creates a PDF report compliant with the task requirements.
+    - anomalies: EpisodeIndex over df's rows, or a boolean mask frame aligned with df
+    - trends: precomputed trend values for df (fitted here if show_trend and missing)
+    - progress: optional callback(fraction, message)
+    - version: dataset version of df, part of the chart cache key (hashed from df when missing)
+    - chart_workers: threads rendering charts (1 = this thread, None = shared render pool)
+    - forecasts: forecast frame (analysis.forecast) drawn on the charts and summarized
     """
+    def report_progress(fraction, message):
+        if progress is not None:
+            progress(fraction, message)
 
     os.makedirs(out_dir, exist_ok=True)
-
-    # Save plot as PNG (render matplotlib from df and selected_mines)
-    plot_path = os.path.join(out_dir, "chart.png")
-    try:
-        render_matplotlib_plot(df.loc[:, ["Date"] + selected_mines], selected_mines, out_path=plot_path)
-    except Exception as e:
-        # fallback: try to render whatever we can
-        try:
-            render_matplotlib_plot(df, selected_mines, out_path=plot_path)
-        except Exception as e2:
-            raise RuntimeError(f"Failed to export plot to PNG: {e}; fallback error: {e2}")
+    report_progress(0.05, "Rendering charts")
+
+    if show_trend and trends is None:
+        trends = trend_lines(df, selected_mines, trend_degree)
+    episodes = anomalies if isinstance(anomalies, EpisodeIndex) else EpisodeIndex.from_frame(anomalies, df)
+
+    # overview + one chart per mine, unchanged charts come from the PNG cache
+    pngs = render_charts(df, selected_mines, version=version, trends=trends if show_trend else None,
+                         episodes=episodes, style={"trend_degree": trend_degree if show_trend else None},
+                         workers=chart_workers, forecasts=forecasts)
+    chart_paths = {}
+    for i, (name, png) in enumerate(pngs.items()):
+        chart_paths[name] = os.path.join(out_dir, f"chart_{i}.png")
+        with open(chart_paths[name], "wb") as f:
+            f.write(png)
+    report_progress(0.4, "Writing statistics")
 
     # Prepare PDF
     pdf = FPDF()
@@ -84,6 +89,7 @@ def generate_full_pdf(df, stats_df, anomalies, events, selected_mines,
         pdf.ln(2)
 
     # Anomaly summary (per selected mine)
+    report_progress(0.55, "Writing anomaly summary")
     pdf.add_page()
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 8, "2. Anomaly Detection Summary", ln=1)
@@ -94,32 +100,42 @@ def generate_full_pdf(df, stats_df, anomalies, events, selected_mines,
         pdf.cell(0, 6, f"{mine} anomalies:", ln=1)
         pdf.set_font("Arial", "", 10)
 
-        if mine in anomalies.columns:
-            outlier_indices = anomalies[mine][anomalies[mine]].index.tolist()
-        else:
-            outlier_indices = []
-
-        if not outlier_indices:
+        rows = episodes.query(mines=[mine])
+        if rows.empty:
             pdf.cell(0, 6, "  No anomalies detected.", ln=1)
         else:
-            for idx in outlier_indices:
-                try:
-                    date = pd.to_datetime(df.loc[idx, "Date"]).strftime("%Y-%m-%d")
-                except Exception:
-                    date = str(df.loc[idx, "Date"])
-                pdf.cell(0, 6, f"  {date}", ln=1)
+            pdf.cell(0, 6, f"  {int(rows['days'].sum())} anomalous days in {len(rows)} episodes", ln=1)
+            shown = rows
+            if len(rows) > MAX_EPISODES_PER_MINE:
+                shown = rows.sort_values(["peak_score", "days"], ascending=False).head(MAX_EPISODES_PER_MINE)
+                shown = shown.sort_values("start")
+            for ep in shown.itertuples(index=False):
+                span = ep.start.strftime("%Y-%m-%d")
+                if ep.days > 1:
+                    span += f" to {ep.end.strftime('%Y-%m-%d')} ({ep.days} days)"
+                peak = "" if pd.isna(ep.peak_value) else f", peak {ep.peak_value:.2f} on {ep.peak_date:%Y-%m-%d}"
+                pdf.cell(0, 6, f"  {span}{peak} [{ep.methods}]", ln=1)
+            if len(rows) > len(shown):
+                pdf.cell(0, 6, f"  ... and {len(rows) - len(shown)} smaller episodes", ln=1)
         pdf.ln(3)
 
-    # Insert plot
+    # Insert plots: overview, then one page per mine
+    report_progress(0.7, "Inserting charts")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 8, "3. Data Visualization", ln=1)
     pdf.ln(3)
-    try:
-        pdf.image(plot_path, w=180)
-    except Exception:
-        pdf.cell(0, 6, "  (Failed to insert chart image)", ln=1)
+    for name, path in chart_paths.items():
+        if name != OVERVIEW:
+            pdf.add_page()
+            pdf.set_font("Arial", "B", 11)
+            pdf.cell(0, 8, f"{name}", ln=1)
+        try:
+            pdf.image(path, w=180)
+        except Exception:
+            pdf.cell(0, 6, "  (Failed to insert chart image)", ln=1)
 
     # Event Sections
+    report_progress(0.8, "Writing events")
     pdf.add_page()
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "4. Spike / Drop Events", ln=1)
@@ -137,6 +153,8 @@ def generate_full_pdf(df, stats_df, anomalies, events, selected_mines,
                 date_str = pd.to_datetime(ev["date"]).strftime("%Y-%m-%d")
             except Exception:
                 date_str = str(ev["date"])
+            if "site" in ev:
+                pdf.cell(0, 6, f"Site: {ev['site']}", ln=1)
             pdf.cell(0, 6, f"Date: {date_str}", ln=1)
             pdf.cell(0, 6, f"Duration: {ev.get('duration', '')} days", ln=1)
             pdf.cell(0, 6, f"Factor: {ev.get('factor', '')}", ln=1)
@@ -145,8 +163,40 @@ def generate_full_pdf(df, stats_df, anomalies, events, selected_mines,
             pdf.multi_cell(0, 5, "Event impact shape: Gaussian bell curve applied across duration.")
             pdf.ln(2)
 
+    # Forecast section
+    if forecasts is not None and len(forecasts):
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, f"5. Forecast (next {len(forecasts)} days, weekly seasonal model)", ln=1)
+        pdf.set_font("Arial", "", 10)
+        last = forecasts.iloc[-1]
+        for mine in selected_mines:
+            if mine not in forecasts.columns:
+                continue
+            pdf.set_font("Arial", "B", 10)
+            pdf.cell(0, 6, f"{mine}", ln=1)
+            pdf.set_font("Arial", "", 10)
+            pdf.cell(0, 6, f"  mean per day: {forecasts[mine].mean():.2f}; "
+                           f"total: {forecasts[mine].sum():.1f}", ln=1)
+            pdf.cell(0, 6, f"  {last['Date']:%Y-%m-%d}: {last[mine]:.2f} "
+                           f"(95% interval {last[f'{mine} lower']:.2f} - {last[f'{mine} upper']:.2f})", ln=1)
+            pdf.ln(2)
+
     # Save final file
     file_path = os.path.join(out_dir, "report.pdf")
     pdf.output(file_path)
+    report_progress(1.0, "Done")
 
     return file_path
+
+
+def generate_pdf_bytes(*args, **kwargs):
+    """
+    generate_full_pdf into a private temporary directory, returning PDF bytes.
+    Safe to call concurrently (no shared output paths).
+    """
+    kwargs.pop("out_dir", None)
+    with tempfile.TemporaryDirectory(prefix="wy_report_") as out_dir:
+        file_path = generate_full_pdf(*args, out_dir=out_dir, **kwargs)
+        with open(file_path, "rb") as f:
+            return f.read()